@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Кэш расстановки ударений (RUAccent) по предложениям: LRU в памяти и SQLite на диске.
+# Описания страниц одного архива во многом повторяются, поэтому модель омографов вызывается только для новых предложений.
+# Единица кэша — предложение: омографы RUAccent разрешаются по контексту, и кэш по отдельным словам менял бы результат
+DEFAULT_ACCENT_CACHE_PATH = os.getenv("ACCENT_CACHE_PATH", "./data/cache/accents.sqlite")
+
+# Разделитель предложений при пакетной обработке одним вызовом process_all
+_BATCH_SEPARATOR = "\n"
+
+
+class accent_cache:
+
+    def __init__(self, accentizer, variant="", path=DEFAULT_ACCENT_CACHE_PATH, memory_items=4096):
+
+        self.accentizer = accentizer
+        self.variant = variant          # настройки RUAccent (размер модели омографов и т.п.), входят в ключ
+        self.path = path
+        self.memory_items = memory_items
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""CREATE TABLE IF NOT EXISTS accents (
+                                    variant TEXT NOT NULL,
+                                    sentence TEXT NOT NULL,
+                                    accented TEXT NOT NULL,
+                                    accessed REAL NOT NULL,
+                                    PRIMARY KEY (variant, sentence))""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _remember(self, sentence, accented):
+        self._memory[sentence] = accented
+        self._memory.move_to_end(sentence)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # Поиск в памяти, затем на диске; возвращает {предложение: результат} для найденных
+    def _lookup(self, sentences):
+        found = {}
+        with self._lock:
+            for sentence in sentences:
+                if sentence in self._memory:
+                    self._memory.move_to_end(sentence)
+                    found[sentence] = self._memory[sentence]
+
+        missing = [s for s in sentences if s not in found]
+        if missing and self.path:
+            with self._connect() as conn:
+                for sentence in missing:
+                    row = conn.execute("SELECT accented FROM accents WHERE variant = ? AND sentence = ?",
+                                       (self.variant, sentence)).fetchone()
+                    if row is not None:
+                        found[sentence] = row[0]
+                if any(s in found for s in missing):
+                    conn.executemany("UPDATE accents SET accessed = ? WHERE variant = ? AND sentence = ?",
+                                     [(time.time(), self.variant, s) for s in missing if s in found])
+            with self._lock:
+                for sentence in missing:
+                    if sentence in found:
+                        self._remember(sentence, found[sentence])
+        return found
+
+    def _store(self, results):
+        with self._lock:
+            for sentence, accented in results.items():
+                self._remember(sentence, accented)
+        if self.path and results:
+            now = time.time()
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO accents VALUES (?, ?, ?, ?)",
+                                 [(self.variant, s, a, now) for s, a in results.items()])
+
+    # Расстановка ударений для пакета предложений: новые предложения обрабатываются одним вызовом process_all
+    # (через разделитель строк); если ответ не делится на то же число строк — по одному
+    def accent_sentences(self, sentences):
+        sentences = [" ".join(s.split()) for s in sentences]
+        found = self._lookup(list(dict.fromkeys(s for s in sentences if s)))
+
+        missing = list(dict.fromkeys(s for s in sentences if s and s not in found))
+        with self._lock:
+            self.hits += len(sentences) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            results = None
+            if len(missing) > 1:
+                lines = self.accentizer.process_all(_BATCH_SEPARATOR.join(missing)).split(_BATCH_SEPARATOR)
+                if len(lines) == len(missing):
+                    results = dict(zip(missing, (line.strip() for line in lines)))
+            if results is None:
+                results = {s: self.accentizer.process_all(s) for s in missing}
+            self._store(results)
+            found.update(results)
+
+        return [found.get(s, s) for s in sentences]
+
+    def accent(self, sentence):
+        return self.accent_sentences([sentence])[0]
+
+    # Удаление записей, к которым давно не обращались
+    def prune(self, max_age_days=180):
+        if not self.path:
+            return 0
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM accents WHERE accessed < ?", (time.time() - max_age_days * 86400,)).rowcount
+
+    def stats(self):
+        entries = 0
+        if self.path:
+            with self._connect() as conn:
+                entries = conn.execute("SELECT COUNT(*) FROM accents WHERE variant = ?", (self.variant,)).fetchone()[0]
+        return {"entries": entries, "memory": len(self._memory), "hits": self.hits, "misses": self.misses}
+
+
+# Обслуживание кэша: python accent_cache.py stats | prune [--days 180]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Кэш расстановки ударений")
+    parser.add_argument("command", choices=["stats", "prune"])
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--path", default=DEFAULT_ACCENT_CACHE_PATH)
+    args = parser.parse_args()
+
+    cache = accent_cache(None, path=args.path)
+    if args.command == "stats":
+        with cache._connect() as conn:
+            for variant, count in conn.execute("SELECT variant, COUNT(*) FROM accents GROUP BY variant"):
+                print(f"{variant}: {count}")
+    else:
+        print(f"Удалено записей: {cache.prune(args.days)}")
@@ -1,19 +1,35 @@
 import os
 import io
-import zipfile
-import re
-import pandas as pd
-from PIL import Image
+import time
+import numpy as np
 
 import streamlit as st
+from dotenv import load_dotenv
+
+# Настройки из .env нужны модулям приложения уже при импорте
+load_dotenv()
+
 from css import NORMAL_CSS  
 
-from llm import llm_solution, TEI_rules
-from speech_generator import generate_speech
+from llm import get_llm_solution, clean_description, TEI_rules
+from catalog import DATASET_DIR, get_catalog
+from search_index import search_index
+from metadata_store import get_store as get_metadata_store
+from thumbnails import get_thumbnail
+from exports import build_export, cached_export
+from metrics import profile_block, start_metrics_server
+from speech_cache import cached_speech_path, save_speech
+from speech_generator import generate_speech_stream, warm_up as warm_up_speech
 
 # Выбор модели
 model_name = "gemini-2.0-flash-thinking-exp-01-21"
 
+# Количество превью на одном экране сетки архива
+PAGES_PER_SCREEN = 24
+
+# Параметры PDF-выгрузки: целевое разрешение (None — без уменьшения) и качество JPEG
+PDF_OPTIONS = {"dpi": None, "quality": 85}
+
 
 # -----------------------
 # Первичная настройка страницы 
@@ -26,9 +42,6 @@ st.set_page_config(page_title="Проект «Понятным языком»",
 # -----------------------
 # Вспомогательные функции 
 # -----------------------
-# Путь к архиву
-DATASET_DIR = "./data/Authors_Manusripts"
-
 # Базовая проверка существования директории
 if not os.path.exists(DATASET_DIR):
     try:
@@ -41,94 +54,72 @@ if not os.path.exists(DATASET_DIR):
         st.error(f"Не удалось создать директорию {DATASET_DIR}: {e}")
         st.stop()  
 
+# Предварительная загрузка TTS-модели в фоне (включается переменной окружения TTS_WARMUP=1);
+# запускается один раз на процесс, а не при каждом перезапуске скрипта
+@st.cache_resource
+def start_speech_warmup():
+    return warm_up_speech()
+
+if os.getenv("TTS_WARMUP") == "1":
+    start_speech_warmup()
+
+# Листинг каталога читается из персистентного индекса (см. catalog.py)
 def list_authors():
-    return sorted([d for d in os.listdir(DATASET_DIR) if os.path.isdir(os.path.join(DATASET_DIR, d))])
+    return get_catalog(DATASET_DIR).list_authors()
 
 def list_archive_types(author):
-    path = os.path.join(DATASET_DIR, author)
-
-    if not os.path.isdir(path):
-        return []
-    return sorted([d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))])
+    return get_catalog(DATASET_DIR).list_archive_types(author)
 
 def list_archives(author, archive_type):
-    path = os.path.join(DATASET_DIR, author, archive_type)
-    # Проверка существования пути 
-    if not os.path.isdir(path):
-        return []
-    return sorted([d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))])
+    return get_catalog(DATASET_DIR).list_archives(author, archive_type)
 
+# Метаданные читаются из бинарного кэша, xlsx перечитывается только при изменении (см. metadata_store.py)
 def load_metadata(author, archive_type, archive_title):
     meta_path = os.path.join(DATASET_DIR, author, archive_type, archive_title, "meta_data.xlsx")
-    if os.path.exists(meta_path):
-        try:
-            return pd.read_excel(meta_path, index_col=0)
-        except Exception: 
-             return None
-    return None
+    return get_metadata_store().load(meta_path)
 
 def get_image_paths(author, archive_type, archive_title):
-    folder = os.path.join(DATASET_DIR, author, archive_type, archive_title)
-    # проверка существования папки
-    if not os.path.isdir(folder):
-        return []
     try:
-        images = sorted([os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('.png')])
-        return images
+        return get_catalog(DATASET_DIR).get_image_paths(author, archive_type, archive_title)
     except Exception: 
         return []
 
-def download_images_zip(author, archive_type, archive_title):
-    folder = os.path.join(DATASET_DIR, author, archive_type, archive_title)
-    buffer = io.BytesIO()
-    # проверка существования папки
-    if not os.path.isdir(folder):
-        buffer.seek(0)
-        return buffer
+# Выгрузки собираются по запросу и кэшируются на диске (см. exports.py); возвращается путь к файлу или None
+def download_images_zip(author, archive_type, archive_title, progress=None):
     try:
-        with zipfile.ZipFile(buffer, "w") as zip_file:
-            for file in os.listdir(folder):
-                if file.lower().endswith('.png'):
-                    file_path = os.path.join(folder, file)
-                    # Проверка, что это файл, перед добавлением
-                    if os.path.isfile(file_path):
-                        zip_file.write(file_path, arcname=file)
+        return build_export("zip", author, archive_type, archive_title, get_image_paths(author, archive_type, archive_title),
+                            progress=progress)
     except Exception:
-         buffer = io.BytesIO() # очистка буфера при ошибке
-    buffer.seek(0)
-    return buffer
-
-def download_pdf(author, archive_type, archive_title):
-    images_paths = get_image_paths(author, archive_type, archive_title)
-    images = []
-    for img_path in images_paths:
-        if os.path.isfile(img_path):
-            try:
-                with Image.open(img_path) as img:
-                    images.append(img.convert("RGB"))
-            except Exception:
-                continue
-    
-    buffer = io.BytesIO()
-    if images:
-        try: 
-            images[0].save(buffer, save_all=True, append_images=images[1:], format="PDF")
-        except Exception:
-             buffer = io.BytesIO() 
-    buffer.seek(0)
-    return buffer
+        return None
+
+# PDF собирается постранично, сканы перекодируются в JPEG с разрешением PDF_DPI
+def download_pdf(author, archive_type, archive_title, progress=None):
+    try:
+        return build_export("pdf", author, archive_type, archive_title, get_image_paths(author, archive_type, archive_title),
+                            progress=progress, **PDF_OPTIONS)
+    except Exception:
+        return None
 
 def download_metadata(author, archive_type, archive_title):
-    meta_path = os.path.join(DATASET_DIR, author, archive_type, archive_title, "meta_data.xlsx")
-    if os.path.exists(meta_path):
-        try:
-            with open(meta_path, "rb") as f:
-                buffer = io.BytesIO(f.read())
-            buffer.seek(0)
-            return buffer
-        except Exception:
-            return None
-    return None
+    meta = load_metadata(author, archive_type, archive_title)
+    if meta is None:
+        return None
+    try:
+        buffer = io.BytesIO(meta.to_csv().encode('utf-8'))
+        buffer.seek(0)
+        return buffer
+    except Exception:
+        return None
+
+# Сервер метрик запускается один раз на процесс
+@st.cache_resource
+def get_metrics_server(port):
+    return start_metrics_server(port)
+
+# Триграммный индекс для поиска по метаданным (общий для всех сессий)
+@st.cache_resource
+def get_search_index():
+    return search_index(get_catalog(DATASET_DIR), load_metadata)
 
 # Callback функция для навигации из поиска 
 def select_archive_callback(author, archive_type, archive):
@@ -176,12 +167,9 @@ def main_app():
              return # Выход, если ошибка отображения
 
         st.subheader("Доступность")
-        # Инициализация LLM 
+        # Общий клиент LLM: создаётся один раз на процесс и не обращается к сети до первого запроса
         try:
-             llm_sol = llm_solution(model=model_name) 
-        except NameError:
-             st.error("Класс llm_solution не найден. Проверьте импорт.")
-             llm_sol = None
+             llm_sol = get_llm_solution(model=model_name) 
         except Exception as e:
              st.error(f"Ошибка инициализации LLM: {e}")
              llm_sol = None
@@ -194,6 +182,25 @@ def main_app():
 
         image_key = image_path # Ключ для результатов
 
+        # Подставить уже готовые результаты (например, после пакетной обработки) без обращения к API
+        if llm_sol and not st.session_state.get(f"cache_checked_{image_key}"):
+            try:
+                ocr_cached = llm_sol.cached_result("image_to_text", img_path=image_path)
+                if ocr_cached is not None:
+                    st.session_state["ocr_text_results"].setdefault(image_key, ocr_cached)
+                    easy_cached = llm_sol.cached_result("text_easy_lang", original_text=ocr_cached)
+                    if easy_cached is not None:
+                        st.session_state["easy_text_results"].setdefault(image_key, easy_cached)
+                    tei_cached = llm_sol.cached_result("tei_generation", img_path=image_path, original_text=ocr_cached)
+                    if tei_cached is not None:
+                        st.session_state["tei_text_results"].setdefault(image_key, tei_cached)
+                desc_cached = llm_sol.cached_result("generate_description", img_path=image_path)
+                if desc_cached is not None:
+                    st.session_state["desc_text_results"].setdefault(image_key, clean_description(desc_cached))
+            except Exception:
+                pass
+            st.session_state[f"cache_checked_{image_key}"] = True
+
         # Функция для скачивания текста 
         def download_text(text, filename, mime, label="📄", help_text="Скачать текст"):
              # Проверка типа и кодирование
@@ -212,12 +219,35 @@ def main_app():
                                 key=download_key,
                                 help=help_text)
 
+        # Потоковый вывод ответа модели: текст появляется по мере генерации,
+        # после завершения временный вывод убирается и возвращается полный текст
+        def stream_text(stream):
+            placeholder = st.empty()
+            with placeholder.container():
+                streamed = st.write_stream(stream)
+            placeholder.empty()
+            return streamed if isinstance(streamed, str) else "".join(map(str, streamed))
+
         # Кнопки и логика LLM 
         if llm_sol:
+            # Все этапы сразу: независимые запросы к модели выполняются параллельно
+            if st.button("Обработать страницу целиком"):
+                with st.spinner("Расшифровка, адаптация, TEI-разметка и тифлокомментирование, подождите..."):
+                    page_results, page_errors = llm_sol.process_page(image_path)
+                for operation, state_key in (("image_to_text", "ocr_text_results"),
+                                             ("text_easy_lang", "easy_text_results"),
+                                             ("tei_generation", "tei_text_results")):
+                    if operation in page_results:
+                        st.session_state[state_key][image_key] = page_results[operation]
+                if "generate_description" in page_results:
+                    st.session_state["desc_text_results"][image_key] = clean_description(page_results["generate_description"])
+                for operation, error in page_errors.items():
+                    st.error(f"Ошибка ({operation}): {error}")
+
             if st.button("Расшифровать текст"):
                 with st.spinner("Обработка изображения, подождите..."):
                     try:
-                        ocr_text = llm_sol.image_to_text(image_path)
+                        ocr_text = stream_text(llm_sol.image_to_text_stream(image_path)).replace("  ", " ")
                         st.session_state["ocr_text_results"][image_key] = ocr_text
                     except Exception as e:
                         st.error(f"Ошибка OCR: {e}")
@@ -239,7 +269,7 @@ def main_app():
                 if st.button("Адаптировать на ясный язык"):
                     with st.spinner("Адаптация текста, подождите..."):
                         try:
-                            easy_text = llm_sol.text_easy_lang(st.session_state["ocr_text_results"][image_key])
+                            easy_text = stream_text(llm_sol.text_easy_lang_stream(st.session_state["ocr_text_results"][image_key]))
                             st.session_state["easy_text_results"][image_key] = easy_text
                         except Exception as e:
                             st.error(f"Ошибка адаптации: {e}")
@@ -259,7 +289,7 @@ def main_app():
                 if st.button("Сгенерировать TEI-разметку"):
                      with st.spinner("Генерация TEI-разметки, подождите..."):
                          try:
-                             tei_text = llm_sol.tei_generation(st.session_state["ocr_text_results"][image_key], image_path)
+                             tei_text = stream_text(llm_sol.tei_generation_stream(st.session_state["ocr_text_results"][image_key], image_path))
                              st.session_state["tei_text_results"][image_key] = tei_text
                          except Exception as e:
                              st.error(f"Ошибка генерации TEI: {e}")
@@ -279,9 +309,9 @@ def main_app():
             if st.button("Тифлокомментирование"):
                  with st.spinner("Генерация описания, подождите..."):
                      try:
-                        desc_text = llm_sol.generate_description(image_path)
+                        desc_text = stream_text(llm_sol.generate_description_stream(image_path))
                         # Очистка 
-                        cleaned_desc = re.sub(" +", " ", re.sub(r"\*", "", desc_text)).strip() 
+                        cleaned_desc = clean_description(desc_text)
                         st.session_state["desc_text_results"][image_key] = cleaned_desc
                      except Exception as e:
                          st.error(f"Ошибка тифлокомментирования: {e}")
@@ -289,9 +319,7 @@ def main_app():
             if image_key in st.session_state["desc_text_results"]:
                 desc_text = st.session_state["desc_text_results"][image_key]
 
-                # состояние для аудио
-                if f"speech_audio_{image_key}" not in st.session_state:
-                    st.session_state[f"speech_audio_{image_key}"] = None
+                # состояние для аудио: только флаг показа плеера, само аудио — в дисковом кэше (speech_cache)
                 if f"show_audio_player_{image_key}" not in st.session_state:
                     st.session_state[f"show_audio_player_{image_key}"] = False
 
@@ -305,29 +333,57 @@ def main_app():
                          desc_bytes = b""
                     download_text(desc_bytes, f"desc_{os.path.basename(image_key)}.txt", "text/plain")
 
-                    if st.button("🔊", key=f"speak_desc_{image_key}", help="Озвучить тифлокомментарий"):
-                        if desc_text:
-                            with st.spinner(""):
-                                try:
-                                    speech_output, sampling_rate = generate_speech(desc_text)
-                                    st.session_state[f"speech_audio_{image_key}"] = (speech_output, sampling_rate)
-                                    st.session_state[f"show_audio_player_{image_key}"] = True # Показать плеер
-                                    st.rerun() 
-                                except ImportError as e:
-                                    st.error(f"Ошибка импорта при генерации речи: {e}. Убедитесь, что все зависимости установлены.")
-                                except Exception as e:
-                                    st.error(f"Ошибка генерации речи: {e}")
-                                    st.session_state[f"speech_audio_{image_key}"] = None
-                                    st.session_state[f"show_audio_player_{image_key}"] = False
-                        else:
-                            st.warning("Нет текста для озвучивания.")
-
-                # аудиоплеер под колонками, если аудио было сгенерировано
+                    speak_clicked = st.button("🔊", key=f"speak_desc_{image_key}", help="Озвучить тифлокомментарий")
+
+                streamed_now = False # аудио озвучено потоково в текущем проходе
+                if speak_clicked and desc_text and cached_speech_path(desc_text) is not None:
+                    # Озвучка уже есть на диске (от другой сессии или пакетной обработки)
+                    st.session_state[f"show_audio_player_{image_key}"] = True
+                elif speak_clicked:
+                    if desc_text:
+                        # Потоковое озвучивание: воспроизведение начинается после первого фрагмента.
+                        # Плеер один: с каждым фрагментом он перерисовывается с удлинившейся записью
+                        # и продолжает с той позиции, до которой дошло воспроизведение
+                        live_audio = st.empty()
+                        with st.spinner(""):
+                            try:
+                                chunks, sampling_rate = [], None
+                                position, played_from, duration = 0.0, None, 0.0
+                                for chunk, sampling_rate in generate_speech_stream(desc_text):
+                                    chunks.append(chunk)
+                                    if played_from is not None:
+                                        # если синтез медленнее воспроизведения, плеер стоит в конце готовой записи
+                                        position = min(position + time.monotonic() - played_from, duration)
+                                    waveform = np.concatenate(chunks)
+                                    live_audio.audio(waveform, sample_rate=sampling_rate, format='audio/wav',
+                                                     start_time=position, autoplay=True)
+                                    played_from, duration = time.monotonic(), len(waveform) / sampling_rate
+                                if not chunks:
+                                    raise ValueError("Не удалось выделить предложения для озвучивания.")
+                                save_speech(desc_text, waveform, sampling_rate)
+                                st.session_state[f"show_audio_player_{image_key}"] = True # Показать плеер
+                                streamed_now = True
+                            except ImportError as e:
+                                st.error(f"Ошибка импорта при генерации речи: {e}. Убедитесь, что все зависимости установлены.")
+                            except Exception as e:
+                                st.error(f"Ошибка генерации речи: {e}")
+                                st.session_state[f"show_audio_player_{image_key}"] = False
+                    else:
+                        st.warning("Нет текста для озвучивания.")
+
+                # аудиоплеер под колонками: воспроизведение и скачивание прямо из файла кэша
                 if st.session_state[f"show_audio_player_{image_key}"]:
-                    audio_data = st.session_state.get(f"speech_audio_{image_key}")
-                    if audio_data is not None:
-                        speech_output, sampling_rate = audio_data
-                        st.audio(speech_output, sample_rate=sampling_rate, format='audio/wav')
+                    speech_file = cached_speech_path(desc_text)
+                    if speech_file is not None:
+                        # после потокового озвучивания полная запись уже в плеере выше
+                        if not streamed_now:
+                            st.audio(speech_file, format='audio/wav')
+                        with open(speech_file, "rb") as f:
+                            st.download_button("Скачать аудио 🎧",
+                                               data=f,
+                                               file_name=f"desc_{os.path.basename(image_key)}.wav",
+                                               mime="audio/wav",
+                                               key=f"download_audio_{image_key}")
                     else:
 
                         st.warning("Аудио было запрошено, но данные отсутствуют.")
@@ -367,13 +423,22 @@ def main_app():
         images = get_image_paths(author, archive_type, archive)
         if images:
             num_columns = 4 
+            # Постраничный вывод сетки для архивов с большим числом страниц
+            start = 0
+            if len(images) > PAGES_PER_SCREEN:
+                ranges = list(range(0, len(images), PAGES_PER_SCREEN))
+                start = st.selectbox("Страницы",
+                                     ranges,
+                                     format_func=lambda r: f"{r + 1}–{min(r + PAGES_PER_SCREEN, len(images))}",
+                                     key=f"grid_range_{archive}")
             cols = st.columns(num_columns)
-            for i, img_path in enumerate(images):
+            for i, img_path in enumerate(images[start:start + PAGES_PER_SCREEN], start=start):
                  with cols[i % num_columns]:
                      # Проверка существования файла перед использованием
                      if os.path.isfile(img_path):
                          try:
-                            st.image(img_path, width=500) 
+                            # в сетку выводится уменьшенное превью, а не исходный скан
+                            st.image(get_thumbnail(img_path, width=320), use_container_width=True) 
                          except Exception as e:
                              st.warning(f"Ошибка загр. стр. {i+1}: {e}")
                          button_key = f"page_{archive.replace(' ','_')}_{i}"
@@ -411,15 +476,26 @@ def main_app():
 
             st.markdown("<div class='download-grid'>", unsafe_allow_html=True)
 
-            pdf_buffer = download_pdf(author, archive_type, archive)
-            st.download_button("Скачать PDF 📑", data=pdf_buffer, file_name=f"{archive}.pdf", mime="application/pdf", key=f"pdf_{archive}")
-
-            zip_buffer = download_images_zip(author, archive_type, archive)
-            st.download_button("Скачать PNG архив 🎞️", data=zip_buffer, file_name=f"{archive}.zip", mime="application/zip", key=f"zip_{archive}")
+            # Кнопка скачивания появляется сразу, если файл уже собран; иначе его можно подготовить по запросу
+            exports = [("pdf", download_pdf, "Скачать PDF 📑", f"{archive}.pdf", "application/pdf"),
+                       ("zip", download_images_zip, "Скачать PNG архив 🎞️", f"{archive}.zip", "application/zip")]
+            for kind, build, label, file_name, mime in exports:
+                export_file = cached_export(kind, author, archive_type, archive, images, **(PDF_OPTIONS if kind == "pdf" else {}))
+                if export_file is None and images:
+                    if st.button(f"Подготовить {kind.upper()}", key=f"build_{kind}_{archive}"):
+                        progress_bar = st.progress(0.0, text="Подготовка файла, подождите...")
+                        export_file = build(author, archive_type, archive,
+                                            progress=lambda done, total: progress_bar.progress(done / total, text=f"Обработано страниц: {done} из {total}"))
+                        progress_bar.empty()
+                        if export_file is None:
+                            st.error(f"Не удалось подготовить {kind.upper()}.")
+                if export_file:
+                    with open(export_file, "rb") as f:
+                        st.download_button(label, data=f, file_name=file_name, mime=mime, key=f"{kind}_{archive}")
 
             meta_buffer = download_metadata(author, archive_type, archive)
             if meta_buffer:
-                st.download_button("Скачать метаданные 🗂️", data=meta_buffer, file_name=f"meta_{archive}.csv", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key=f"meta_{archive}")
+                st.download_button("Скачать метаданные 🗂️", data=meta_buffer, file_name=f"meta_{archive}.csv", mime="text/csv", key=f"meta_{archive}")
             else:
                 st.write("Метаданные отсутствуют.")
 
@@ -494,19 +570,7 @@ def main_app():
                     # проверка на пустой запрос
                     if search_query:
                         with st.spinner("Выполняется поиск..."): 
-                            for author in list_authors():
-                                for arch_type in list_archive_types(author):
-                                    for archive in list_archives(author, arch_type):
-                                        meta = load_metadata(author, arch_type, archive)
-                                        if meta is not None:
-                                            try: # обработка ошибок на случай не-строковых данных
-                                                meta_str = meta.to_string().lower()
-                                                if search_query.lower() in meta_str:
-                                                    results.append({"author": author,
-                                                                    "archive_type": arch_type,
-                                                                    "archive": archive})
-                                            except AttributeError:
-                                                continue
+                            results = get_search_index().search(search_query)
                     # Логика отображения результатов 
                     if results:
                         st.success(f"Найдено {len(results)} результатов:")
@@ -536,32 +600,10 @@ def main_app():
                 selected_year_ext = st.text_input("Поиск по метаданным (дата, название, тип документа и т.д.)", key="adv_year")
 
                 if st.button("Найти (расширенный поиск)"):
-                    results = []
                     with st.spinner("Выполняется поиск..."): 
-                        authors_list = [selected_author_ext] if selected_author_ext else list_authors()
-                        for author in authors_list:
-                            arch_types = [selected_archive_type_ext] if selected_archive_type_ext else list_archive_types(author)
-                            # Пропуск, если выбранный тип не существует для автора
-                            if selected_archive_type_ext and not arch_types:
-                                continue
-                            for arch_type in arch_types:
-                                for archive in list_archives(author, arch_type):
-                                    meta = load_metadata(author, arch_type, archive)
-                                    if meta is not None:
-                                         # Условие поиска по году 
-                                        cond = True
-                                        if selected_year_ext:
-                                             try: # Добавлена обработка ошибок
-                                                 meta_str = meta.to_string().lower()
-                                                 if selected_year_ext.lower() not in meta_str: # Поиск подстроки года
-                                                     cond = False
-                                             except AttributeError:
-                                                 cond = False 
-
-                                        if cond:
-                                            results.append({"author": author,
-                                                            "archive_type": arch_type,
-                                                            "archive": archive})
+                        results = get_search_index().search(selected_year_ext,
+                                                            author=selected_author_ext or None,
+                                                            archive_type=selected_archive_type_ext or None)
                     # Логика отображения результатов 
                     if results:
                         st.success(f"Найдено {len(results)} результатов:")
@@ -622,4 +664,8 @@ def main_app():
 
 
 if __name__ == "__main__":
-    main_app()
+    # Необязательная локальная точка метрик (METRICS_PORT) и профилирование отрисовки (PROFILE_RENDER=1)
+    if os.getenv("METRICS_PORT"):
+        get_metrics_server(int(os.getenv("METRICS_PORT")))
+    with profile_block("page_render"):
+        main_app()
@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+# переменные окружения (ключ API, настройки кэшей) должны быть загружены до импорта модулей, читающих их при импорте
+load_dotenv()
+
+from catalog import DATASET_DIR, catalog_index
+from llm import OCR_BATCH_PAGES, get_llm_solution, clean_description
+
+
+# Этапы обработки страницы в порядке выполнения
+STAGES = ("ocr", "easy", "tei", "desc", "speech")
+
+DEFAULT_MANIFEST_PATH = "./data/cache/batch_manifest.json"
+DEFAULT_MODEL = "gemini-2.0-flash-thinking-exp-01-21"
+
+
+# Манифест прогресса: какие этапы каких страниц уже выполнены.
+# Каждый выполненный этап дописывается строкой в журнал (<path>.journal), поэтому прерванный запуск
+# продолжается с места остановки; журнал сворачивается в основной JSON при загрузке, когда становится
+# длиннее самого манифеста, и в конце запуска
+class progress_manifest:
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.pages = json.load(f)
+        except (OSError, ValueError):
+            self.pages = {}
+
+        if os.path.exists(self.journal_path):
+            self._replay()
+            self.compact()
+
+    def _replay(self):
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # недописанная последняя строка (запуск прерван во время записи)
+                        break
+                    self.pages[record["key"]] = record["page"]
+        except OSError:
+            pass
+
+    def _page_key(self, img_path):
+        stat = os.stat(img_path)
+        return os.path.abspath(img_path), f"{stat.st_size}|{stat.st_mtime_ns}"
+
+    # Выполнен ли этап для текущей версии скана
+    def is_done(self, img_path, stage):
+        key, version = self._page_key(img_path)
+        with self._lock:
+            page = self.pages.get(key)
+            return bool(page) and page.get("version") == version and stage in page.get("done", [])
+
+    def mark(self, img_path, stage, error=None):
+        key, version = self._page_key(img_path)
+        with self._lock:
+            page = self.pages.get(key)
+            if not page or page.get("version") != version:
+                page = self.pages[key] = {"version": version, "done": [], "errors": {}}
+
+            if error is None:
+                if stage not in page["done"]:
+                    page["done"].append(stage)
+                page["errors"].pop(stage, None)
+            else:
+                page["errors"][stage] = str(error)
+
+            self._append(key, page)
+
+    # Свернуть журнал в основной JSON
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    # Дописать состояние страницы в журнал; вызывается под self._lock
+    def _append(self, key, page):
+        if self._journal is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps({"key": key, "page": page}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+        self._journal_records += 1
+        if self._journal_records > max(1000, len(self.pages)):
+            self._compact()
+
+    # Сначала атомарно заменяется основной JSON, потом удаляется журнал (повторное применение журнала безвредно)
+    def _compact(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.pages, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_records = 0
+
+
+# Обработка одной страницы: OCR -> ясный язык -> TEI -> тифлокомментарий -> озвучка.
+# Результаты LLM сохраняются в кэш llm_solution, озвучка — в каталог speech_cache.SPEECH_DIR
+def process_page(img_path, llm_sol, manifest, stages=STAGES):
+    results = {}
+
+    # этапы, от которых зависят запрошенные
+    needed = set(stages)
+    if needed & {"easy", "tei"}:
+        needed.add("ocr")
+    if "speech" in needed:
+        needed.add("desc")
+
+    def run(stage, compute):
+        if stage not in needed:
+            return None
+        if manifest.is_done(img_path, stage) and stage not in ("ocr", "desc"):
+            return None
+        try:
+            value = compute()
+            manifest.mark(img_path, stage)
+            return value
+        except Exception as e:
+            manifest.mark(img_path, stage, error=e)
+            results.setdefault("errors", {})[stage] = str(e)
+            return None
+
+    # OCR и описание нужны следующим этапам, поэтому берутся из кэша даже для выполненных страниц
+    ocr_text = run("ocr", lambda: llm_sol.image_to_text(img_path))
+    if ocr_text:
+        run("easy", lambda: llm_sol.text_easy_lang(ocr_text))
+        run("tei", lambda: llm_sol.tei_generation(ocr_text, img_path))
+
+    desc_text = run("desc", lambda: clean_description(llm_sol.generate_description(img_path)))
+    if desc_text:
+        run("speech", lambda: _synthesize(desc_text))
+
+    return results
+
+
+def _synthesize(text):
+    from speech_cache import cached_speech_path, save_speech
+
+    if cached_speech_path(text) is None:
+        from speech_generator import generate_speech
+
+        waveform, sampling_rate = generate_speech(text)
+        save_speech(text, waveform, sampling_rate)
+    return True
+
+
+# Выбор страниц по автору, типу и архиву
+def collect_pages(catalog, author=None, archive_type=None, archive=None):
+    pages = []
+    for key in catalog.iter_archives(author=author, archive_type=archive_type):
+        if archive and key[2] != archive:
+            continue
+        pages.extend(catalog.get_image_paths(*key))
+    return pages
+
+
+# Предварительное пакетное OCR: страницы без выполненного OCR распознаются по ocr_batch за запрос
+# в пределах одного архива; process_page затем берёт расшифровку из кэша
+def prefetch_ocr(pages, llm_sol, manifest, ocr_batch, executor):
+    archives = {}
+    for p in pages:
+        if not manifest.is_done(p, "ocr"):
+            archives.setdefault(os.path.dirname(p), []).append(p)
+
+    futures = [executor.submit(llm_sol.image_to_text_batch, archive_pages[i:i + ocr_batch], ocr_batch)
+               for archive_pages in archives.values()
+               for i in range(0, len(archive_pages), ocr_batch)]
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as e:
+            # ошибки OCR будут записаны при обработке страниц
+            print(f"Пакетное OCR: {e}")
+
+
+def run_batch(pages, llm_sol, manifest, stages=STAGES, workers=4, ocr_batch=OCR_BATCH_PAGES):
+    pending = [p for p in pages if not all(manifest.is_done(p, stage) for stage in stages)]
+    print(f"Страниц: {len(pages)}, к обработке: {len(pending)}")
+
+    failed = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if ocr_batch > 1 and set(stages) & {"ocr", "easy", "tei"}:
+            prefetch_ocr(pending, llm_sol, manifest, ocr_batch, executor)
+
+        futures = {executor.submit(process_page, p, llm_sol, manifest, stages): p for p in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            errors = future.result().get("errors")
+            if errors:
+                failed += 1
+                print(f"[{done}/{len(pending)}] {futures[future]}: ошибки {errors}")
+            else:
+                print(f"[{done}/{len(pending)}] {futures[future]}")
+
+    manifest.compact()
+    print(f"Готово за {time.monotonic() - started:.1f} c, страниц с ошибками: {failed}")
+    return failed
+
+
+# Пакетная обработка: python batch_pipeline.py --author "..." [--type ...] [--archive ...] [--workers 4]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетная обработка архивов: OCR, ясный язык, TEI, тифлокомментарий, озвучка")
+    parser.add_argument("--root", default=DATASET_DIR)
+    parser.add_argument("--author")
+    parser.add_argument("--type", dest="archive_type")
+    parser.add_argument("--archive")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"этапы через запятую из {', '.join(STAGES)}")
+    parser.add_argument("--workers", type=int, default=4, help="число одновременно обрабатываемых страниц")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--ocr-batch", type=int, default=OCR_BATCH_PAGES, help="страниц архива в одном запросе OCR (1 — по одной)")
+    parser.add_argument("--changes", help="список изменений manuscripts_parser.py: обработать только новые и изменённые сканы")
+    args = parser.parse_args()
+
+    stages = tuple(stage for stage in args.stages.split(",") if stage)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Неизвестные этапы: {', '.join(sorted(unknown))}")
+
+    pages = collect_pages(catalog_index(args.root), args.author, args.archive_type, args.archive)
+    if args.changes:
+        with open(args.changes, encoding="utf-8") as f:
+            changed = {os.path.abspath(c["path"]) for c in json.load(f) if c["change"] in ("added", "modified")}
+        pages = [p for p in pages if os.path.abspath(p) in changed]
+    failed = run_batch(pages, get_llm_solution(model=args.model), progress_manifest(args.manifest), stages, args.workers, args.ocr_batch)
+    raise SystemExit(1 if failed else 0)
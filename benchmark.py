@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from PIL import Image, ImageDraw
+
+import metrics
+from catalog import catalog_index
+from exports import build_export
+from fake_genai import fake_backend
+from llm import llm_solution
+from llm_cache import result_cache
+from metadata_store import metadata_store
+from search_index import search_index
+
+
+# Офлайн-замеры производительности на синтетическом корпусе; результат — JSON для отслеживания регрессий
+# Пример: python benchmark.py --sizes 2,8,32 --output bench.json
+
+ARCHIVE_TYPES = ("Рукописи", "Письма")
+WORDS = ("письмо", "рукопись", "черновик", "стихотворение", "роман", "дневник", "Москва", "Петербург", "открытка")
+
+
+# Синтетический скан: светлый лист с «строками»
+def _make_page(path, rng, size):
+    img = Image.new("L", size, 235)
+    draw = ImageDraw.Draw(img)
+    for y in range(60, size[1] - 60, 36):
+        x = 50
+        while x < size[0] - 80:
+            width = rng.randint(20, 90)
+            draw.line((x, y, x + width, y + rng.randint(-3, 3)), fill=rng.randint(20, 80), width=2)
+            x += width + rng.randint(8, 20)
+    img.save(path)
+
+
+# Синтетический корпус: authors авторов, у каждого ARCHIVE_TYPES x archives архивов по pages страниц
+def generate_corpus(root, authors, archives=4, pages=3, page_size=(900, 1200), seed=0):
+    rng = random.Random(seed)
+    for a in range(authors):
+        for archive_type in ARCHIVE_TYPES:
+            for n in range(archives):
+                folder = os.path.join(root, f"Автор {a:03d}", archive_type, f"Архив {n:03d}")
+                os.makedirs(folder, exist_ok=True)
+                for p in range(1, pages + 1):
+                    _make_page(os.path.join(folder, f"{p}.png"), rng, page_size)
+                meta = {"Название: ": f"{rng.choice(WORDS)} {a}-{n}",
+                        "Дата: ": str(rng.randint(1900, 1990)),
+                        "Описание: ": " ".join(rng.choice(WORDS) for _ in range(20))}
+                with pd.ExcelWriter(os.path.join(folder, "meta_data.xlsx")) as writer:
+                    pd.DataFrame([meta]).T.to_excel(writer)
+
+
+def _timed(fn, repeat=1):
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return {"seconds": statistics.median(times), "min": min(times), "repeat": repeat}, result
+
+
+def bench_corpus(root, work_dir, repeat):
+    results = {}
+
+    catalog = catalog_index(root, os.path.join(work_dir, "catalog.json"), refresh_interval=0)
+    results["catalog_cold"], _ = _timed(lambda: list(catalog.iter_archives()))
+    results["catalog_warm"], archives = _timed(lambda: list(catalog.iter_archives()), repeat)
+
+    store = metadata_store(os.path.join(work_dir, "metadata"))
+    load = lambda author, archive_type, archive: store.load(os.path.join(root, author, archive_type, archive, "meta_data.xlsx"))
+    index = search_index(catalog, load, os.path.join(work_dir, "search_index.json"))
+    results["search_index_build"], _ = _timed(index.update)
+    results["search_simple"], found = _timed(lambda: index.search("письмо"), repeat)
+    results["search_simple"]["results"] = len(found)
+    first_author = archives[0][0]
+    results["search_advanced"], found = _timed(lambda: index.search("19", author=first_author, archive_type=ARCHIVE_TYPES[1]), repeat)
+    results["search_advanced"]["results"] = len(found)
+
+    key = archives[0]
+    image_paths = catalog.get_image_paths(*key)
+    export_dir = os.path.join(work_dir, "exports")
+    results["download_pdf_cold"], _ = _timed(lambda: build_export("pdf", *key, image_paths, export_dir))
+    results["download_pdf_cached"], _ = _timed(lambda: build_export("pdf", *key, image_paths, export_dir), repeat)
+    results["download_images_zip_cold"], _ = _timed(lambda: build_export("zip", *key, image_paths, export_dir))
+
+    return results, image_paths
+
+
+def bench_llm(image_paths, work_dir, latency, chunk_latency):
+    backend = fake_backend(first_chunk_latency=latency, chunk_latency=chunk_latency)
+    cache = result_cache(os.path.join(work_dir, "llm_results.sqlite"))
+    llm_sol = llm_solution(backend=backend, cache=cache)
+
+    results = {}
+    results["page_pipeline_cold"], _ = _timed(lambda: llm_sol.process_page(image_paths[0]))
+    results["page_pipeline_cached"], _ = _timed(lambda: llm_sol.process_page(image_paths[0]))
+
+    first_chunk = {}
+    def stream():
+        started = time.perf_counter()
+        for _ in llm_sol.image_to_text_stream(image_paths[-1]):
+            first_chunk.setdefault("seconds", time.perf_counter() - started)
+    results["ocr_stream"], _ = _timed(stream)
+    results["ocr_stream"]["time_to_first_chunk"] = first_chunk.get("seconds")
+
+    # пакетное OCR всех страниц архива на пустом кэше
+    batch_backend = fake_backend(first_chunk_latency=latency, chunk_latency=chunk_latency)
+    batch_sol = llm_solution(backend=batch_backend, cache=result_cache(os.path.join(work_dir, "llm_results_batch.sqlite")))
+    results["ocr_batch_cold"], _ = _timed(lambda: batch_sol.image_to_text_batch(image_paths))
+    results["ocr_batch_cold"]["pages"] = len(image_paths)
+    results["ocr_batch_cold"]["model_calls"] = batch_backend.calls
+
+    results["model_calls"] = backend.calls
+    results["request_chars"] = backend.sent_chars
+    results["system_instruction_chars"] = backend.system_instruction_chars
+    return results
+
+
+def bench_tts(text):
+    try:
+        from speech_generator import generate_speech
+    except ImportError as e:
+        return {"skipped": f"TTS недоступен: {e}"}
+
+    results = {}
+    results["generate_speech_cold"], (waveform, sampling_rate) = _timed(lambda: generate_speech(text))
+    results["generate_speech_warm"], (waveform, sampling_rate) = _timed(lambda: generate_speech(text))
+    results["generate_speech_warm"]["real_time_factor"] = results["generate_speech_warm"]["seconds"] / (len(waveform) / sampling_rate)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-замеры производительности")
+    parser.add_argument("--sizes", default="1,4,16", help="число авторов в синтетическом корпусе, через запятую")
+    parser.add_argument("--archives", type=int, default=4, help="архивов каждого типа у автора")
+    parser.add_argument("--pages", type=int, default=3, help="страниц в архиве")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="задержка до первого фрагмента офлайн-модели, с")
+    parser.add_argument("--chunk-latency", type=float, default=0.05, help="задержка между фрагментами, с")
+    parser.add_argument("--skip-tts", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="не удалять синтетический корпус")
+    parser.add_argument("--output", help="файл для JSON-результата (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "params": vars(args),
+              "runs": []}
+
+    # метрики замеров не смешиваются с метриками приложения
+    metrics_dir = tempfile.mkdtemp(prefix="htr-bench-metrics-")
+    metrics.METRICS_LOG = os.path.join(metrics_dir, "metrics.jsonl")
+    metrics.METRICS_FILE = os.path.join(metrics_dir, "metrics.prom")
+
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        work_dir = tempfile.mkdtemp(prefix=f"htr-bench-{size}-")
+        root = os.path.join(work_dir, "Authors_Manusripts")
+        try:
+            generate_corpus(root, size, args.archives, args.pages)
+            run = {"authors": size, "archives": size * len(ARCHIVE_TYPES) * args.archives,
+                   "pages": size * len(ARCHIVE_TYPES) * args.archives * args.pages}
+            run["corpus"], image_paths = bench_corpus(root, work_dir, args.repeat)
+            run["llm"] = bench_llm(image_paths, work_dir, args.latency, args.chunk_latency)
+            report["runs"].append(run)
+            print(f"authors={size}: готово", file=sys.stderr)
+        finally:
+            if not args.keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not args.skip_tts:
+        report["tts"] = bench_tts("Лист бумаги с рукописным текстом, написанным чернилами. "
+                                  "В верхней части страницы видна дата, ниже идут ровные строки.")
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+
+
+# Путь к архиву
+DATASET_DIR = "./data/Authors_Manusripts"
+
+# Путь к сохранённому манифесту каталога
+DEFAULT_MANIFEST_PATH = "./data/cache/catalog.json"
+
+MANIFEST_VERSION = 1
+
+
+def _subdirs(path):
+    with os.scandir(path) as entries:
+        return sorted(entry.name for entry in entries if entry.is_dir())
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+# Индекс каталога: автор -> тип архива -> архив -> страницы.
+# Сохраняется на диск и обновляется инкрементально: пересканируются только каталоги, у которых изменилось mtime
+class catalog_index:
+
+    def __init__(self, root=DATASET_DIR, manifest_path=DEFAULT_MANIFEST_PATH, refresh_interval=30):
+
+        self.root = root
+        self.manifest_path = manifest_path
+        self.refresh_interval = refresh_interval  # не чаще, чем раз в N секунд проверять mtime каталогов
+
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+        self._tree = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("root") == os.path.abspath(self.root):
+                return manifest["tree"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {"mtime": None, "authors": {}}
+
+    def save(self):
+        with self._lock:
+            manifest = {"version": MANIFEST_VERSION, "root": os.path.abspath(self.root), "tree": self._tree}
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+
+    # Сканирование одного архива: список страниц с размерами и наличие метаданных
+    def _scan_archive(self, path):
+        pages = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith('.png') and entry.is_file():
+                    pages.append({"name": entry.name, "size": entry.stat().st_size})
+        pages.sort(key=lambda page: page["name"])
+
+        meta_path = os.path.join(path, "meta_data.xlsx")
+        return {"pages": pages,
+                "meta_mtime": _mtime(meta_path)}
+
+    # Обновить уровень дерева: добавить новые каталоги, удалить исчезнувшие,
+    # пересканировать изменившиеся. Возвращает список изменений
+    def _sync_level(self, node, path, children_key, child_fn, prefix):
+        changes = []
+        mtime = _mtime(path)
+
+        if node.get("mtime") != mtime:
+            names = _subdirs(path) if mtime is not None else []
+            old = node.get(children_key, {})
+
+            for name in set(old) - set(names):
+                changes.append(("removed", prefix + (name,)))
+
+            node[children_key] = {name: old.get(name, {"mtime": None}) for name in names}
+            node["mtime"] = mtime
+
+        for name, child in node.get(children_key, {}).items():
+            changes.extend(child_fn(child, os.path.join(path, name), prefix + (name,)))
+
+        return changes
+
+    def _sync_archive(self, node, path, key):
+        mtime = _mtime(path)
+        meta_mtime = _mtime(os.path.join(path, "meta_data.xlsx"))
+
+        if mtime is None or (node.get("mtime") == mtime and node.get("meta_mtime") == meta_mtime):
+            return []
+
+        change = "added" if node.get("mtime") is None else "modified"
+        node.update(self._scan_archive(path))
+        node["mtime"] = mtime
+        return [(change, key)]
+
+    def _sync_type(self, node, path, key):
+        return self._sync_level(node, path, "archives", self._sync_archive, key)
+
+    def _sync_author(self, node, path, key):
+        return self._sync_level(node, path, "types", self._sync_type, key)
+
+    # Инкрементальное обновление индекса; возвращает список изменений вида (тип, (автор, тип архива, архив))
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+                return []
+
+            changes = self._sync_level(self._tree, self.root, "authors", self._sync_author, ())
+            self._last_refresh = time.monotonic()
+
+            if changes:
+                self.save()
+            return changes
+
+    def _node(self, *names):
+        self.refresh()
+        node = self._tree
+        for children_key, name in zip(("authors", "types", "archives"), names):
+            node = node.get(children_key, {}).get(name)
+            if node is None:
+                return None
+        return node
+
+    def list_authors(self):
+        return sorted(self._node().get("authors", {}))
+
+    def list_archive_types(self, author):
+        node = self._node(author)
+        return sorted(node.get("types", {})) if node else []
+
+    def list_archives(self, author, archive_type):
+        node = self._node(author, archive_type)
+        return sorted(node.get("archives", {})) if node else []
+
+    def archive_info(self, author, archive_type, archive_title):
+        node = self._node(author, archive_type, archive_title)
+        if not node or "pages" not in node:
+            return None
+        return {"pages": len(node["pages"]),
+                "size": sum(page["size"] for page in node["pages"]),
+                "has_metadata": node.get("meta_mtime") is not None,
+                "meta_mtime": node.get("meta_mtime")}
+
+    def get_image_paths(self, author, archive_type, archive_title):
+        node = self._node(author, archive_type, archive_title)
+        if not node:
+            return []
+        folder = os.path.join(self.root, author, archive_type, archive_title)
+        return [os.path.join(folder, page["name"]) for page in node.get("pages", [])]
+
+    # Обход всех архивов с необязательным фильтром по автору и типу
+    def iter_archives(self, author=None, archive_type=None):
+        authors = [author] if author else self.list_authors()
+        for a in authors:
+            types = [archive_type] if archive_type else self.list_archive_types(a)
+            for t in types:
+                for archive in self.list_archives(a, t):
+                    yield a, t, archive
+
+
+# Общий индекс на процесс
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(root=DATASET_DIR):
+    with _catalogs_lock:
+        if root not in _catalogs:
+            _catalogs[root] = catalog_index(root)
+        return _catalogs[root]
+
+
+# Построение/обновление манифеста: python catalog.py [--root ...]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Индекс каталога автографов")
+    parser.add_argument("--root", default=DATASET_DIR)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    args = parser.parse_args()
+
+    catalog = catalog_index(args.root, args.manifest)
+    changes = catalog.refresh(force=True)
+    catalog.save()
+    print(f"Изменений: {len(changes)}, архивов в индексе: {sum(1 for _ in catalog.iter_archives())}")
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import os
+import threading
+import zipfile
+import zlib
+
+from PIL import Image
+
+
+# Каталог с готовыми файлами выгрузки (PDF, ZIP)
+DEFAULT_EXPORT_DIR = "./data/cache/exports"
+
+EXPORT_KINDS = ("pdf", "zip")
+
+# Блокировки на архив, чтобы два пользователя не собирали один и тот же файл одновременно
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+# Отпечаток содержимого архива: имена, размеры и mtime сканов
+def fingerprint(image_paths):
+    digest = hashlib.sha1()
+    for img_path in image_paths:
+        try:
+            stat = os.stat(img_path)
+        except OSError:
+            continue
+        digest.update(f"{os.path.basename(img_path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _archive_dir(author, archive_type, archive_title, export_dir):
+    name = hashlib.sha1(f"{author}/{archive_type}/{archive_title}".encode("utf-8")).hexdigest()
+    return os.path.join(export_dir, name)
+
+
+# Параметры сборки (dpi, качество и т.д.) входят в имя файла
+def export_path(kind, author, archive_type, archive_title, image_paths, export_dir=DEFAULT_EXPORT_DIR, **options):
+    suffix = "".join(f"_{k}-{v}" for k, v in sorted(options.items()) if v is not None)
+    return os.path.join(_archive_dir(author, archive_type, archive_title, export_dir), f"{fingerprint(image_paths)}{suffix}.{kind}")
+
+
+# Путь к готовой выгрузке или None, если её ещё не собирали для текущего содержимого архива
+def cached_export(kind, author, archive_type, archive_title, image_paths, export_dir=DEFAULT_EXPORT_DIR, **options):
+    path = export_path(kind, author, archive_type, archive_title, image_paths, export_dir, **options)
+    return path if os.path.isfile(path) else None
+
+
+# Минимальный потоковый PDF-писатель: каждая страница кодируется и записывается сразу,
+# поэтому в памяти одновременно находится только одно изображение
+class _pdf_writer:
+
+    def __init__(self, f):
+        self.f = f
+        self.pos = 0
+        self.offsets = {}
+
+    def write(self, data):
+        self.f.write(data)
+        self.pos += len(data)
+
+    def obj(self, num, body, stream=None):
+        self.offsets[num] = self.pos
+        self.write(f"{num} 0 obj\n".encode("ascii"))
+        self.write(body)
+        if stream is not None:
+            self.write(b"\nstream\n")
+            self.write(stream)
+            self.write(b"\nendstream")
+        self.write(b"\nendobj\n")
+
+    def finish(self, root, size):
+        xref = self.pos
+        self.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode("ascii"))
+        for num in range(1, size):
+            self.write(f"{self.offsets[num]:010d} 00000 n \n".encode("ascii"))
+        self.write(f"trailer\n<< /Size {size} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+
+
+# Подготовка одной страницы: уменьшение до нужного DPI и сжатие (JPEG или без потерь)
+def _encode_page(img, dpi, quality, lossless, source_dpi):
+    img_dpi = img.info.get("dpi", (source_dpi, source_dpi))[0] or source_dpi
+    img = img.convert("L") if img.mode in ("1", "L", "LA", "I", "I;16") else img.convert("RGB")
+
+    if dpi and dpi < img_dpi:
+        scale = dpi / img_dpi
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.Resampling.LANCZOS)
+        img_dpi = dpi
+
+    # размер страницы в пунктах сохраняет физический размер скана
+    width_pt, height_pt = img.width * 72 / img_dpi, img.height * 72 / img_dpi
+    colorspace = "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+
+    if lossless:
+        data, pdf_filter = zlib.compress(img.tobytes(), 6), "/FlateDecode"
+    else:
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+        data, pdf_filter = buffer.getvalue(), "/DCTDecode"
+
+    return img.width, img.height, width_pt, height_pt, colorspace, pdf_filter, data
+
+
+# Сборка PDF постранично. dpi — целевое разрешение (None — без уменьшения),
+# quality — качество JPEG, lossless — сжатие без потерь, progress(done, total) — отчёт о прогрессе
+def write_pdf(image_paths, f, dpi=None, quality=85, lossless=False, source_dpi=72, progress=None):
+    pdf = _pdf_writer(f)
+    pdf.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    pdf.obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    kids = []
+    total = len(image_paths)
+    for done, img_path in enumerate(image_paths, start=1):
+        try:
+            with Image.open(img_path) as img:
+                width, height, width_pt, height_pt, colorspace, pdf_filter, data = \
+                    _encode_page(img, dpi, quality, lossless, source_dpi)
+        except Exception:
+            continue
+
+        page_num = 3 + 3 * len(kids)
+        kids.append(page_num)
+
+        pdf.obj(page_num + 2, (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                               f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter {pdf_filter} "
+                               f"/Length {len(data)} >>").encode("ascii"), data)
+        del data
+
+        content = f"q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q".encode("ascii")
+        pdf.obj(page_num + 1, f"<< /Length {len(content)} >>".encode("ascii"), content)
+        pdf.obj(page_num, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] "
+                           f"/Resources << /XObject << /Im0 {page_num + 2} 0 R >> >> "
+                           f"/Contents {page_num + 1} 0 R >>").encode("ascii"))
+
+        if progress:
+            progress(done, total)
+
+    if not kids:
+        raise ValueError("Нет изображений для PDF.")
+
+    pdf.obj(2, f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode("ascii"))
+    pdf.finish(root=1, size=3 + 3 * len(kids))
+
+
+def write_zip(image_paths, f, progress=None):
+    with zipfile.ZipFile(f, "w") as zip_file:
+        for done, img_path in enumerate(image_paths, start=1):
+            zip_file.write(img_path, arcname=os.path.basename(img_path))
+            if progress:
+                progress(done, len(image_paths))
+
+
+_WRITERS = {"pdf": write_pdf, "zip": write_zip}
+
+
+# Собрать выгрузку (если её ещё нет) и вернуть путь к файлу. Файл пишется во временный файл
+# и переименовывается по готовности. Выгрузки устаревшего содержимого того же архива удаляются
+def build_export(kind, author, archive_type, archive_title, image_paths, export_dir=DEFAULT_EXPORT_DIR, progress=None, **options):
+    path = export_path(kind, author, archive_type, archive_title, image_paths, export_dir, **options)
+
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(path, threading.Lock())
+
+    with lock:
+        if os.path.isfile(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                _WRITERS[kind](image_paths, f, progress=progress, **options)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        current = fingerprint(image_paths)
+        for name in os.listdir(os.path.dirname(path)):
+            if name.endswith(f".{kind}") and not name.startswith(current):
+                try:
+                    os.remove(os.path.join(os.path.dirname(path), name))
+                except OSError:
+                    pass
+
+    return path
+
@@ -0,0 +1,197 @@
+import hashlib
+import io
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from PIL import Image, ImageDraw
+
+
+# Локальная замена сайта "Автограф" для проверки manuscripts_parser без сети:
+# те же элементы разметки (main_faces, sidebar, view-content, block-system-main) и сканы PNG.
+# Пример: python fake_autograph.py --port 8765, затем
+#         python manuscripts_parser.py --base-url http://127.0.0.1:8765/ru "Автор 0"
+
+
+@lru_cache(maxsize=256)
+def _scan_bytes(author, archive, material, page, revision=0):
+    img = Image.new("L", (600, 800), 235)
+    draw = ImageDraw.Draw(img)
+    seed = author * 1000 + archive * 100 + material * 10 + page + revision
+    for y in range(40, 760, 30):
+        draw.line((30, y, 560 - (seed * 7 + y) % 200, y), fill=40, width=2)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _scan_href(author, archive, material, page):
+    token = hashlib.sha1(f"{author}-{archive}-{material}-{page}".encode()).hexdigest()
+    return f"/a{author}/sites/default/files/styles/scan/{token}/{archive}-{material}-{page}.png"
+
+
+def _page(body):
+    return f"<html><head><meta charset='utf-8'></head><body>{body}</body></html>"
+
+
+# Разметка корпуса: authors авторов, у каждого archives архивов (последний пустой) по materials материалов.
+# Поля можно менять на ходу, чтобы имитировать обновление сайта; revisions[(author, archive, material, page)]
+# меняет содержимое отдельного скана
+class fake_site:
+
+    def __init__(self, authors=2, archives=2, materials=3, scans=2):
+        self.authors = authors
+        self.archives = archives
+        self.materials = materials
+        self.scans = scans
+        self.revisions = {}
+
+    def main_page(self, base):
+        faces = "".join(f'<a href="{base}/a{a}" title="Автор {a}"><img src="/face{a}.jpg"></a>' for a in range(self.authors))
+        login = ('<form action="/ru/node?destination=node" method="post"><div>'
+                 '<input type="text" name="name"><input type="password" name="pass">'
+                 '<input type="hidden" name="form_build_id" value="form-fixture">'
+                 '<input type="hidden" name="form_id" value="user_login_block">'
+                 '<input type="submit" name="op" value="Войти"></div></form>')
+        return _page(f'<div class="main_faces">{faces}</div>{login}')
+
+    def author_page(self, author):
+        links = "".join(f'<a href="/archive/{n}">"Архив {n}"</a>' for n in range(self.archives + 1))
+        return _page(f'<div class="region region-sidebar-first sidebar">{links}</div>')
+
+    def archive_page(self, author, archive):
+        if archive >= self.archives:
+            return _page('<div id="content"><p>Материалы не найдены</p></div>')
+        items = []
+        for m in range(self.materials):
+            items.append(f'<div class="views-row"><a class="language-link" href="/material/{archive}/{m}">ru</a>'
+                         f'<a rel="tag" title=" Письмо: {m % 2}? " href="/tag/{m}">тег</a></div>')
+        # повтор первого материала: в архиве сайта ссылки на материал иногда дублируются
+        items.append(f'<div class="views-row"><a class="language-link" href="/material/{archive}/0">ru</a>'
+                     f'<a rel="tag" title="Дубликат" href="/tag/0">тег</a></div>')
+        return _page(f'<div id="content"><div class="view-content">{"".join(items)}</div></div>')
+
+    def material_page(self, author, archive, material):
+        fields = ['<div class="field-item even">служебное поле</div>']
+        for name, value in (("Название: ", f"Письмо {author}-{archive}-{material}"), ("Дата: ", str(1900 + material))):
+            fields.append(f'<h2>{name}</h2><div class="field-item even">{value}</div>')
+        fields.append(f'<div class="field-item even">Описание материала {material}</div>')
+        scans = "".join(f'<a href="{_scan_href(author, archive, material, p)}">скан {p}</a>' for p in range(1, self.scans + 1))
+        return _page(f'<div id="block-system-main">{"".join(fields)}<a href="/short">назад</a>{scans}</div>')
+
+
+# Запуск сервера в фоновом потоке; server.base_url — адрес главной страницы, server.hits — счётчик запросов,
+# server.requests — список (путь, заголовок Range) всех GET-запросов,
+# server.max_parallel — наибольшее число одновременно обрабатываемых запросов
+def start_fixture_server(port=0, host="127.0.0.1", **site_kwargs):
+    site = fake_site(**site_kwargs)
+    lock = threading.Lock()
+
+    class handler(BaseHTTPRequestHandler):
+
+        # ответ с ETag; поддерживаются If-None-Match и Range (с If-Range), как у статики сайта
+        def _send(self, body, content_type):
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            status, start = 200, 0
+            ranges = self.headers.get("Range", "")
+            if ranges.startswith("bytes=") and self.headers.get("If-Range", etag) == etag:
+                start = int(ranges[len("bytes="):].split("-")[0] or 0)
+                if start >= len(body):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(body)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body) - start))
+            self.send_header("ETag", etag)
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            self.end_headers()
+            self.wfile.write(body[start:])
+
+        def _route(self):
+            parts = unquote(urlparse(self.path).path).strip("/").split("/")
+            base = f"http://{host}:{server.server_address[1]}"
+            if parts == ["ru"] or parts == ["ru", "node"]:
+                return site.main_page(base), "text/html; charset=utf-8"
+            if not parts[0].startswith("a") or not parts[0][1:].isdigit():
+                return None, None
+            author = int(parts[0][1:])
+            if len(parts) == 1:
+                return site.author_page(author), "text/html; charset=utf-8"
+            if parts[1] == "archive" and len(parts) == 3:
+                return site.archive_page(author, int(parts[2])), "text/html; charset=utf-8"
+            if parts[1] == "material" and len(parts) == 4:
+                return site.material_page(author, int(parts[2]), int(parts[3])), "text/html; charset=utf-8"
+            if parts[1] == "sites":
+                archive, material, page = map(int, parts[-1].split(".")[0].split("-"))
+                revision = site.revisions.get((author, archive, material, page), 0)
+                return _scan_bytes(author, archive, material, page, revision), "image/png"
+            return None, None
+
+        def do_GET(self):
+            with lock:
+                server.hits += 1
+                server.requests.append((self.path, self.headers.get("Range")))
+                server.active += 1
+                server.max_parallel = max(server.max_parallel, server.active)
+            try:
+                body, content_type = self._route()
+                if body is None:
+                    self.send_error(404)
+                    return
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self._send(body, content_type)
+            finally:
+                with lock:
+                    server.active -= 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.send_response(302)
+            self.send_header("Set-Cookie", "SESSfixture=1; Path=/")
+            self.send_header("Location", "/ru")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), handler)
+    server.hits = server.active = server.max_parallel = 0
+    server.requests = []
+    server.site = site
+    server.base_url = f"http://{host}:{server.server_address[1]}/ru"
+    threading.Thread(target=server.serve_forever, name="fake-autograph", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Локальный сервер с разметкой сайта Автограф")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--authors", type=int, default=2)
+    parser.add_argument("--archives", type=int, default=2)
+    parser.add_argument("--materials", type=int, default=3)
+    parser.add_argument("--scans", type=int, default=2)
+    args = parser.parse_args()
+
+    server = start_fixture_server(args.port, authors=args.authors, archives=args.archives,
+                                  materials=args.materials, scans=args.scans)
+    print(f"Сервер запущен: {server.base_url}")
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,129 @@
+import threading
+import time
+
+
+# Локальная замена genai.GenerativeModel для офлайн-замеров: настраиваемая задержка,
+# потоковая выдача ответа фрагментами и счётчики запросов
+
+
+class fake_usage:
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class fake_chunk:
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+# Ответ в стиле GenerateContentResponse: перебор фрагментов, resolve() и text
+class fake_response:
+
+    def __init__(self, pieces, first_chunk_latency, chunk_latency, usage):
+        self._pieces = pieces
+        self._first_chunk_latency = first_chunk_latency
+        self._chunk_latency = chunk_latency
+        self._done = False
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        for i, piece in enumerate(self._pieces):
+            time.sleep(self._first_chunk_latency if i == 0 else self._chunk_latency)
+            last = i == len(self._pieces) - 1
+            yield fake_chunk(piece, self.usage_metadata if last else None)
+        self._done = True
+
+    def resolve(self):
+        if not self._done:
+            for _ in self:
+                pass
+
+    @property
+    def text(self):
+        self.resolve()
+        return "".join(self._pieces)
+
+
+def _default_responder(contents):
+    text_parts = [part for part in contents if isinstance(part, str)]
+    images = sum(1 for part in contents if isinstance(part, dict))
+    answer = (f"Ответ офлайн-модели на запрос длиной {sum(map(len, text_parts))} символов "
+              f"с {images} изображениями. ") * 8
+
+    # пакетный запрос (см. llm_solution.image_to_text_batch): ответ по каждой странице под её разделителем
+    markers = [part for part in text_parts if part.startswith("=== СТРАНИЦА ")]
+    if markers:
+        return "\n".join(f"{marker}\n{answer}" for marker in markers)
+    return answer
+
+
+class fake_model:
+
+    def __init__(self, model_name, generation_config=None, first_chunk_latency=0.5, chunk_latency=0.05,
+                 chunk_chars=40, responder=_default_responder, system_instruction=None):
+
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self._generation_config = dict(generation_config or {})
+        # статический префикс: задаётся при создании модели, но, как и в настоящем SDK, уходит с каждым запросом
+        self.system_instruction = system_instruction
+
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_chars = chunk_chars
+        self.responder = responder
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.requests = []     # содержимое всех запросов (для проверок)
+        self.sent_chars = 0    # объём отправленного текста, включая system_instruction
+        self.system_instruction_chars = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        contents = contents if isinstance(contents, list) else [contents]
+
+        with self._lock:
+            self.calls += 1
+            self.requests.append(contents)
+            self.sent_chars += sum(len(part) for part in contents if isinstance(part, str)) + len(self.system_instruction or "")
+            self.system_instruction_chars += len(self.system_instruction or "")
+
+        text = self.responder(contents)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        usage = fake_usage((sum(len(part) for part in contents if isinstance(part, str)) + len(self.system_instruction or "")) // 4,
+                           len(text) // 4)
+
+        response = fake_response(pieces, self.first_chunk_latency, self.chunk_latency, usage)
+        if not stream:
+            response.resolve()
+        return response
+
+
+# Фабрика моделей для llm_solution(backend=...); созданные модели доступны в .models
+class fake_backend:
+
+    def __init__(self, **model_kwargs):
+        self.model_kwargs = model_kwargs
+        self.models = []
+
+    def __call__(self, model_name, generation_config=None, **kwargs):
+        model = fake_model(model_name, generation_config, **{**self.model_kwargs, **kwargs})
+        self.models.append(model)
+        return model
+
+    @property
+    def calls(self):
+        return sum(model.calls for model in self.models)
+
+    # Объём текста, отправленного в запросах, и его часть, пришедшаяся на system_instruction.
+    # Кэш контекста (CachedContent) заменой не моделируется, поэтому экономии входных токенов здесь не видно
+    @property
+    def sent_chars(self):
+        return sum(model.sent_chars for model in self.models)
+
+    @property
+    def system_instruction_chars(self):
+        return sum(model.system_instruction_chars for model in self.models)
@@ -0,0 +1,75 @@
+import io
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image
+
+
+# Параметры подготовки скана к отправке в модель:
+# max_side — максимальная сторона (пикселей), image_format — JPEG или WEBP, quality — качество сжатия,
+# tile_side — при значении не None большие листы дополнительно режутся на фрагменты такого размера
+image_options = namedtuple("image_options", ["max_side", "image_format", "quality", "tile_side"])
+
+DEFAULT_OPTIONS = image_options(max_side=int(os.getenv("LLM_IMAGE_MAX_SIDE", "2048")),
+                                image_format=os.getenv("LLM_IMAGE_FORMAT", "JPEG").upper(),
+                                quality=int(os.getenv("LLM_IMAGE_QUALITY", "90")),
+                                tile_side=None)
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def _signature(img_path):
+    stat = os.stat(img_path)
+    return os.path.abspath(img_path), stat.st_size, stat.st_mtime_ns
+
+
+# Декодирование скана. Результат не кэшируется: полноразмерный лист занимает до сотни МБ,
+# а после кодирования он больше не нужен — повторно используются только готовые данные (_payload)
+def _decode(path):
+    with Image.open(path) as img:
+        return img.convert("RGB") if img.mode not in ("RGB", "L") else img.copy()
+
+
+def _encode(img, options):
+    buffer = io.BytesIO()
+    if options.image_format == "PNG":
+        img.save(buffer, format="PNG", optimize=True)
+    else:
+        img.save(buffer, format=options.image_format, quality=options.quality)
+    return {"mime_type": _MIME_TYPES[options.image_format], "data": buffer.getvalue()}
+
+
+def _tiles(img, tile_side):
+    for top in range(0, img.height, tile_side):
+        for left in range(0, img.width, tile_side):
+            yield img.crop((left, top, min(left + tile_side, img.width), min(top + tile_side, img.height)))
+
+
+# LRU-кэш готовых к отправке данных: один раз на скан и набор параметров (ключ учитывает размер и mtime файла)
+@lru_cache(maxsize=64)
+def _payload(path, size, mtime_ns, options):
+    img = _decode(path)
+
+    parts = []
+    if options.max_side and max(img.size) > options.max_side:
+        overview = img.copy()
+        overview.thumbnail((options.max_side, options.max_side), Image.Resampling.LANCZOS)
+    else:
+        overview = img
+    parts.append(_encode(overview, options))
+
+    # фрагменты исходного разрешения для очень больших листов
+    if options.tile_side and max(img.size) > options.tile_side:
+        parts.extend(_encode(tile, options) for tile in _tiles(img, options.tile_side))
+
+    return tuple(parts)
+
+
+# Части запроса с изображением: обзорное изображение и (опционально) фрагменты
+def prepare_image(img_path, options=DEFAULT_OPTIONS):
+    return list(_payload(*_signature(img_path), options))
+
+
+def payload_size(parts):
+    return sum(len(part["data"]) for part in parts)
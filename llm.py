@@ -1,9 +1,19 @@
 from IPython.display import Markdown
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+import datetime
+import re
 import textwrap
-from PIL import Image
-import pandas as pd
+import threading
+import time
 import os
 import google.generativeai as genai
+from google.api_core.exceptions import InvalidArgument
+
+from llm_cache import get_cache, file_hash, text_hash
+from vocabulary import load_vocabulary, vocabulary_for_text
+from metrics import record
+from image_prep import DEFAULT_OPTIONS as DEFAULT_IMAGE_OPTIONS, payload_size, prepare_image
 
 
 TEI_rules = '''
@@ -60,29 +70,349 @@ TEI_rules = '''
          '''
 
 
+# Версии промптов: увеличить при изменении текста промпта, чтобы не использовать устаревшие результаты из кэша
+PROMPT_VERSIONS = {"image_to_text": 1,
+                   "text_easy_lang": 3,
+                   "generate_description": 1,
+                   "tei_generation": 2}
+
+
+# Размер основной части словаря для ясного языка: она постоянна и входит в статический префикс промпта
+CORE_VOCABULARY_SIZE = 150
+
+# Статические части промптов (инструкции, правила TEI, основной словарь) не зависят от вызова.
+# Они передаются модели один раз как system_instruction (или через кэш контекста Gemini при LLM_CONTEXT_CACHE=1),
+# а в каждом запросе отправляется только переменная часть. Версия префикса — PROMPT_VERSIONS
+def prompt_prefix(operation):
+
+    if operation == "text_easy_lang":
+        return ("Твоя задача адаптировать исходный текст на ясный язык, "
+                "основываясь на следующем словаре из наиболее частотных и простых русских слов. "
+                "Важно, чтобы люди с ограниченными возможностями в восприятии информации и ментальными особенностями поняли его смысл. "
+                "Постарайся использовать слова из этого словаря, но ты можешь использовать и другие слова, если необходимо сформировать связные предложения. "
+                "Также постарайся сохранить структуру и стилистику исходного текста. "
+                f"Словарь: {', '.join(load_vocabulary()[:CORE_VOCABULARY_SIZE])}. "
+                "В запросе словарь может быть дополнен словами, близкими к словам исходного текста. "
+                "В ответе представь только адаптированный текст.")
+
+    if operation == "tei_generation":
+        return ("Тебе предоставлен расшифрованный текст рукописи и настоящий скан этой рукописи. "
+                "Для расшифрованного текста представь TEI-разметку. Можешь также опираться на предоставленный скан для дополнительной валидации и информации. "
+                "Мною был определён конкретный набор тегов и правил TEI-разметки, я хочу, чтобы ты использовал только их. "
+                "Если ты не можешь определить или найти какую-то информацию, удовлетворяющую тегу - то просто игнорируй его. "
+                "Если ты уверен, что на предоставленном скане нет текста, а только какой-то рисунок или фотография - то напиши 'На данном скане текст не обнаружен...'. "
+                f"Вот правила TEI-разметки: {TEI_rules}")
+
+    raise ValueError(f"No static prompt prefix for operation: {operation}")
+
+
+# Кэш контекста Gemini для статических префиксов (платное хранение, есть минимальный размер контекста;
+# если создать его не удалось, префикс передаётся как system_instruction)
+CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE") == "1"
+CONTEXT_CACHE_TTL = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600"))
+
+
+# Пакетное OCR: не больше OCR_BATCH_PAGES страниц и OCR_BATCH_MB мегабайт изображений в одном запросе
+# (ограничение Gemini на встроенные данные запроса — 20 МБ)
+OCR_BATCH_PAGES = int(os.getenv("LLM_OCR_BATCH_PAGES", "6"))
+OCR_BATCH_BYTES = int(os.getenv("LLM_OCR_BATCH_MB", "15")) * 1024 * 1024
+
+PAGE_MARKER = "=== СТРАНИЦА {} ==="
+_PAGE_MARKER = re.compile(r"^[ \t]*=+[ \t]*СТРАНИЦА[ \t]+(\d+)[ \t]*=+[ \t]*$", re.MULTILINE)
+
+
+# Разделение ответа пакетного OCR на страницы по разделителям PAGE_MARKER.
+# Возвращает None, если разделители не идут строго по порядку 1..count или какая-то страница пуста
+def split_pages(text, count):
+    matches = list(_PAGE_MARKER.finditer(text or ""))
+    if [int(m.group(1)) for m in matches] != list(range(1, count + 1)):
+        return None
+
+    ends = [m.start() for m in matches[1:]] + [len(text)]
+    pages = [text[m.end():end].strip() for m, end in zip(matches, ends)]
+    return pages if all(pages) else None
+
+
+# Очистка тифлокомментария от markdown-разметки перед показом и озвучиванием
+def clean_description(text):
+    return re.sub(" +", " ", re.sub(r"\*", "", text)).strip()
+
+
+# Список моделей с поддержкой generateContent кэшируется на MODELS_TTL секунд
+MODELS_TTL = 3600
+
+_available_models = {"names": None, "fetched": 0.0}
+_available_models_lock = threading.Lock()
+
+def list_available_models(ttl=MODELS_TTL):
+    with _available_models_lock:
+        if _available_models["names"] is None or time.monotonic() - _available_models["fetched"] > ttl:
+            _available_models["names"] = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+            _available_models["fetched"] = time.monotonic()
+        return list(_available_models["names"])
+
+
+# Модель со статическим префиксом промпта операции. Настоящая модель (с system_instruction или кэшем контекста)
+# создаётся при первом запросе и пересоздаётся по истечении срока хранения кэша контекста.
+# Имя и параметры генерации — как у базовой модели, поэтому ключи кэша результатов не зависят от способа передачи префикса.
+# Если модель отклоняет system_instruction при первом запросе (экспериментальные thinking-модели отвечают
+# 400 "Developer instruction is not enabled"), префикс до конца работы отправляется в начале каждого запроса
+class prefixed_model:
+
+    def __init__(self, solution, operation):
+
+        self.solution = solution
+        self.operation = operation
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._expires = None
+        self._inline_prefix = None   # префикс для отправки в каждом запросе, если бэкенд не принимает system_instruction
+        self._verified = False       # модель с префиксом уже отвечала без ошибки
+
+    @property
+    def model_name(self):
+        return self.solution.model.model_name
+
+    @property
+    def _generation_config(self):
+        return self.solution.model._generation_config
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with self._lock:
+            if self._model is None or (self._expires is not None and time.monotonic() > self._expires):
+                self._model, self._expires, self._inline_prefix = self._create()
+            model, inline_prefix, verified = self._model, self._inline_prefix, self._verified
+
+        try:
+            response = model.generate_content([inline_prefix, *contents] if inline_prefix else contents, stream=stream, **kwargs)
+        except InvalidArgument as e:
+            if verified or inline_prefix:
+                raise
+            record("system_instruction", operation=self.operation, model=self.model_name, status="fallback", reason=str(e))
+            prefix = prompt_prefix(self.operation)
+            with self._lock:
+                self._model, self._expires, self._inline_prefix, self._verified = self.solution.model, None, prefix, True
+            return self.solution.model.generate_content([prefix, *contents], stream=stream, **kwargs)
+
+        self._verified = True
+        return response
+
+    def _create(self):
+        solution = self.solution
+        prefix = prompt_prefix(self.operation)
+
+        if solution.backend is not None:
+            try:
+                return solution.backend(solution.model_name, solution.generation_config, system_instruction=prefix), None, None
+            except TypeError:
+                return solution.model, None, prefix
+
+        if CONTEXT_CACHE:
+            try:
+                cached = genai.caching.CachedContent.create(model=solution.model_name,
+                                                            display_name=f"htr-{self.operation}-v{PROMPT_VERSIONS[self.operation]}",
+                                                            system_instruction=prefix,
+                                                            ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL))
+                model = genai.GenerativeModel.from_cached_content(cached, generation_config=solution.generation_config)
+                # пересоздать незадолго до истечения срока хранения
+                return model, time.monotonic() + CONTEXT_CACHE_TTL - 60, None
+            except Exception as e:
+                record("context_cache", operation=self.operation, model=solution.model_name, status="fallback", reason=str(e))
+
+        model = genai.GenerativeModel(model_name=solution.model_name, generation_config=solution.generation_config,
+                                      system_instruction=prefix)
+        return model, None, None
+
+
 class llm_solution:
 
-    def __init__(self, api_key=None, model='gemini-1.5-flash', temperature=None, top_p=None, pres_penalty=None, freq_penalty=None):  
+    def __init__(self, api_key=None, model='gemini-1.5-flash', temperature=None, top_p=None, pres_penalty=None, freq_penalty=None, cache=True, backend=None):  
 
         from dotenv import load_dotenv
 
         load_dotenv()
-        
-        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
 
-        if not self.api_key:
-            raise ValueError("API key is missing. Set GOOGLE_API_KEY in the .env file or pass it explicitly.")
-        
-        genai.configure(api_key=self.api_key)
+        # backend(model_name, generation_config) создаёт модель; по умолчанию genai.GenerativeModel,
+        # для офлайн-замеров можно подставить fake_genai.fake_backend
+        self.backend = backend
 
-        self.available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+        if backend is None:
+            self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
 
-        self.model = genai.GenerativeModel(model, generation_config={"temperature":temperature, "top_p":top_p, 
-                                                                     "presence_penalty":pres_penalty, "frequency_penalty":freq_penalty})
-        
-        self.model_for_description = genai.GenerativeModel(model_name='gemini-2.0-flash-thinking-exp-01-21', 
-                                                           generation_config={"temperature":temperature, "top_p":top_p, 
-                                                                              "presence_penalty":pres_penalty, "frequency_penalty":freq_penalty})
+            if not self.api_key:
+                raise ValueError("API key is missing. Set GOOGLE_API_KEY in the .env file or pass it explicitly.")
+            
+            genai.configure(api_key=self.api_key)
+
+        self.model_name = model
+        self.generation_config = {"temperature":temperature, "top_p":top_p, 
+                                  "presence_penalty":pres_penalty, "frequency_penalty":freq_penalty}
+
+        # Параметры подготовки сканов к отправке (размер, формат, качество, нарезка на фрагменты)
+        self.image_options = DEFAULT_IMAGE_OPTIONS
+
+        # Персистентный кэш результатов (cache=False отключает, можно передать свой result_cache)
+        self.cache = get_cache() if cache is True else (cache or None)
+
+        # Модели со статическим префиксом промпта (см. prompt_prefix)
+        self.prefixed_models = {operation: prefixed_model(self, operation) for operation in ("text_easy_lang", "tei_generation")}
+
+    # Модели создаются при первом обращении, список доступных моделей запрашивается лениво (см. list_available_models)
+    @cached_property
+    def model(self):
+        return self._create_model(self.model_name)
+
+    @cached_property
+    def model_for_description(self):
+        return self._create_model('gemini-2.0-flash-thinking-exp-01-21')
+
+    def _create_model(self, model_name):
+        if self.backend is not None:
+            return self.backend(model_name, self.generation_config)
+        return genai.GenerativeModel(model_name=model_name, generation_config=self.generation_config)
+
+    @property
+    def available_models(self):
+        return list_available_models()
+
+    def _cache_key(self, operation, model, parts):
+        # параметры генерации тоже влияют на ответ, поэтому входят в ключ
+        config = sorted((k, v) for k, v in (model._generation_config or {}).items() if v is not None)
+        return self.cache.make_key(operation, model.model_name, PROMPT_VERSIONS[operation], config, *parts)
+
+    # Получить результат из кэша или выполнить запрос и сохранить его
+    def _run(self, operation, *args):
+
+        model, parts, build_contents, postprocess = self._request(operation, *args)
+        stats = {"operation": operation, "model": model.model_name, "cache": "disabled" if self.cache is None else "miss"}
+        started = time.perf_counter()
+
+        try:
+            key = self._cache_key(operation, model, parts) if self.cache is not None else None
+            result = self.cache.get(key) if key is not None else None
+
+            if result is None:
+                result = postprocess(self._generate(model, self._contents(build_contents, stats), stats))
+                if key is not None:
+                    self.cache.put(key, operation, model.model_name, result)
+            else:
+                stats["cache"] = "hit"
+
+            stats.setdefault("time_to_first_chunk", time.perf_counter() - started)
+            return result
+        except Exception as e:
+            stats["error"] = repr(e)
+            raise
+        finally:
+            record("llm", wall_time=time.perf_counter() - started, **stats)
+
+    # Потоковый вариант _run: фрагменты текста выдаются по мере поступления,
+    # итоговый текст сохраняется в кэш. Результат из кэша выдаётся одним фрагментом
+    def _run_stream(self, operation, *args):
+
+        model, parts, build_contents, postprocess = self._request(operation, *args)
+        stats = {"operation": f"{operation}_stream", "model": model.model_name, "cache": "disabled" if self.cache is None else "miss"}
+        started = time.perf_counter()
+
+        try:
+            key = self._cache_key(operation, model, parts) if self.cache is not None else None
+            if key is not None:
+                result = self.cache.get(key)
+                if result is not None:
+                    stats["cache"] = "hit"
+                    stats["time_to_first_chunk"] = time.perf_counter() - started
+                    yield result
+                    return
+
+            pieces = []
+            for piece in self._generate_stream(model, self._contents(build_contents, stats), stats):
+                if not pieces:
+                    stats["time_to_first_chunk"] = time.perf_counter() - started
+                pieces.append(piece)
+                yield piece
+
+            if key is not None:
+                self.cache.put(key, operation, model.model_name, postprocess("".join(pieces)))
+        except Exception as e:
+            stats["error"] = repr(e)
+            raise
+        finally:
+            record("llm", wall_time=time.perf_counter() - started, **stats)
+
+    # Построение содержимого запроса с учётом объёма отправляемых изображений
+    def _contents(self, build_contents, stats):
+        contents = build_contents()
+        stats["image_bytes"] = sum(len(part["data"]) for part in contents if isinstance(part, dict))
+        return contents
+
+    @staticmethod
+    def _usage(response, stats):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            stats["prompt_tokens"] = getattr(usage, "prompt_token_count", None)
+            stats["response_tokens"] = getattr(usage, "candidates_token_count", None)
+
+    def _generate(self, model, contents, stats):
+        started = time.perf_counter()
+        response = model.generate_content(contents, stream=True)
+        # перебор фрагментов вместо resolve() позволяет замерить время до первого фрагмента
+        for _ in response:
+            stats.setdefault("time_to_first_chunk", time.perf_counter() - started)
+        self._usage(response, stats)
+        return response.text
+
+    def _generate_stream(self, model, contents, stats):
+        chunk = None
+        for chunk in model.generate_content(contents, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:  # фрагмент без текста (например, служебный)
+                continue
+            if text:
+                yield text
+        # итоговое число токенов приходит в последнем фрагменте
+        if chunk is not None:
+            self._usage(chunk, stats)
+
+    # Описание запроса для операции: модель, части ключа кэша, построение содержимого запроса и постобработка ответа
+    def _request(self, operation, *args):
+
+        if operation == "image_to_text":
+            img_path, = args
+            return (self.model, [file_hash(img_path), tuple(self.image_options)],
+                    lambda: self._image_to_text_contents(img_path), lambda text: text.replace("  ", " "))
+
+        if operation == "text_easy_lang":
+            original_text, = args
+            return (self.prefixed_models[operation], [text_hash(original_text)],
+                    lambda: self._text_easy_lang_contents(original_text), lambda text: text)
+
+        if operation == "generate_description":
+            img_path, = args
+            return (self.model_for_description, [file_hash(img_path), tuple(self.image_options)],
+                    lambda: self._generate_description_contents(img_path), lambda text: text)
+
+        if operation == "tei_generation":
+            original_text, img_path = args
+            return (self.prefixed_models[operation], [text_hash(original_text), file_hash(img_path), tuple(self.image_options)],
+                    lambda: self._tei_generation_contents(original_text, img_path), lambda text: text)
+
+        raise ValueError(f"Unknown operation: {operation}")
+
+    # Только чтение из кэша, без обращения к API: результат операции или None
+    def cached_result(self, operation, img_path=None, original_text=None):
+
+        if self.cache is None:
+            return None
+
+        args = {"image_to_text": (img_path,),
+                "text_easy_lang": (original_text,),
+                "generate_description": (img_path,),
+                "tei_generation": (original_text, img_path)}[operation]
+        model, parts, _, _ = self._request(operation, *args)
+
+        return self.cache.get(self._cache_key(operation, model, parts))
         
     # Форматирование ответа LLM в более удобный для чтения вид
     def to_markdown(self, text):
@@ -91,65 +421,185 @@ class llm_solution:
         
     # Расшифровка текста рукописи
     def image_to_text(self, img_path):
+        return self._run("image_to_text", img_path)
+
+    def image_to_text_stream(self, img_path):
+        return self._run_stream("image_to_text", img_path)
 
-        self.img = Image.open(img_path)
+    def _image_to_text_contents(self, img_path):
 
         prompt = ("Внимательно проанализируй картинку и расшифруй, что на ней написано. "
                   "Далее ещё раз перепроверь, можешь поискать совпадения в интернете, чтобы было проще верифицировать (не нужно мне их выводить). "
                   "Если ты уверен, что на предоставленном скане нет текста, а только какой-то рисунок или фотография - то напиши 'На данном скане текст не обнаружен...' . "
                   "Если ты уверен, что на предоставленном скане есть текст, то в ответе представь только расшифрованный текст с той же структурой, что и на картинке ")
 
-        response = self.model.generate_content([prompt, self.img], stream=True)
-        response.resolve()
-            
-        return response.text.replace("  ", " ")
+        return [prompt, *prepare_image(img_path, self.image_options)]
+
+    # Расшифровка нескольких страниц одного архива: по нескольку сканов в запросе.
+    # Ответ делится на страницы по разделителям; если деление не прошло проверку или запрос не удался,
+    # страницы пакета расшифровываются по одной. Результаты попадают в тот же кэш, что и у image_to_text
+    def image_to_text_batch(self, img_paths, max_pages=OCR_BATCH_PAGES, max_bytes=OCR_BATCH_BYTES, max_workers=4):
+
+        results = {}
+        for img_path in img_paths:
+            cached = self.cached_result("image_to_text", img_path=img_path)
+            if cached is not None:
+                results[img_path] = cached
+
+        pending = list(dict.fromkeys(p for p in img_paths if p not in results))
+
+        for batch in self._ocr_batches(pending, max_pages, max_bytes):
+            texts = self._ocr_batch(batch) if len(batch) > 1 else None
+            if texts is None:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    texts = list(executor.map(self.image_to_text, batch))
+            results.update(zip(batch, texts))
+
+        return [results[img_path] for img_path in img_paths]
+
+    # Деление страниц на пакеты с учётом числа страниц и объёма изображений
+    def _ocr_batches(self, img_paths, max_pages, max_bytes):
+        batch, batch_bytes = [], 0
+        for img_path in img_paths:
+            size = payload_size(prepare_image(img_path, self.image_options))
+            if batch and (len(batch) >= max_pages or batch_bytes + size > max_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(img_path)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    # Один пакетный запрос; None, если запрос не удался или ответ не делится на страницы
+    def _ocr_batch(self, batch):
+
+        model = self.model
+        stats = {"operation": "image_to_text_batch", "model": model.model_name, "pages": len(batch)}
+        started = time.perf_counter()
+
+        try:
+            contents = self._contents(lambda: self._image_to_text_batch_contents(batch), stats)
+            texts = split_pages(self._generate(model, contents, stats), len(batch))
+            stats["split"] = "ok" if texts else "failed"
+        except Exception as e:
+            stats["error"] = repr(e)
+            texts = None
+        finally:
+            record("llm", wall_time=time.perf_counter() - started, **stats)
+
+        if texts is None:
+            return None
+
+        results = []
+        for img_path, text in zip(batch, texts):
+            model, parts, _, postprocess = self._request("image_to_text", img_path)
+            text = postprocess(text)
+            if self.cache is not None:
+                self.cache.put(self._cache_key("image_to_text", model, parts), "image_to_text", model.model_name, text)
+            results.append(text)
+        return results
+
+    def _image_to_text_batch_contents(self, img_paths):
+
+        prompt = (f"Тебе предоставлены сканы {len(img_paths)} страниц рукописи, перед каждым сканом указан его номер. "
+                  "Внимательно проанализируй каждую картинку и расшифруй, что на ней написано. "
+                  "Далее ещё раз перепроверь, можешь поискать совпадения в интернете, чтобы было проще верифицировать (не нужно мне их выводить). "
+                  "Если ты уверен, что на скане нет текста, а только какой-то рисунок или фотография - то для этого скана напиши 'На данном скане текст не обнаружен...' . "
+                  "Если на скане есть текст, то представь только расшифрованный текст с той же структурой, что и на картинке. "
+                  f"Ответ для каждого скана начни с отдельной строки вида '{PAGE_MARKER.format(1)}' с номером скана, "
+                  "сохраняя порядок сканов, и не добавляй ничего, кроме расшифровок.")
+
+        contents = [prompt]
+        for number, img_path in enumerate(img_paths, start=1):
+            contents.append(PAGE_MARKER.format(number))
+            contents.extend(prepare_image(img_path, self.image_options))
+        return contents
 
     # Адаптация расшифрованного текста на ясный язык
     def text_easy_lang(self, original_text):
+        return self._run("text_easy_lang", original_text)
 
-        vocabulary = pd.read_csv("./data/most_frequent_words.csv", header=None).iloc[:, -1].values
-        self.vocabulary_for_promp = [", ".join(vocabulary)]
+    def text_easy_lang_stream(self, original_text):
+        return self._run_stream("text_easy_lang", original_text)
 
-        prompt = ("Твоя задача адаптировать исходный текст на ясный язык, "
-                  "основываясь на следующем словаре из наиболее частотных и простых русских слов. "
-                  "Важно, чтобы люди с ограниченными возможностями в восприятии информации и ментальными особенностями поняли его смысл. "
-                  "Постарайся использовать слова из этого словаря, но ты можешь использовать и другие слова, если необходимо сформировать связные предложения. "
-                  "Также постарайся сохранить структуру и стилистику исходного текста. "
-                  f"Словарь: {self.vocabulary_for_promp}. "
-                  f"Исходный текст: {original_text} . "
-                  "В ответе представь только адаптированный текст.")
+    # Переменная часть запроса; инструкции и основной словарь — в prompt_prefix("text_easy_lang")
+    def _text_easy_lang_contents(self, original_text):
 
-        easy_lang = self.model.generate_content([prompt], stream=True)
-        easy_lang.resolve()
+        # к основному словарю добавляются только слова, близкие к словам исходного текста (см. vocabulary.py)
+        self.vocabulary_for_promp = [", ".join(vocabulary_for_text(original_text, core_size=0))]
 
-        return easy_lang.text
+        prompt = (f"Дополнительные слова словаря: {self.vocabulary_for_promp}. "
+                  f"Исходный текст: {original_text} .")
+
+        return [prompt]
     
     # Генерация описания к изображению (тифлокомментирование)
     def generate_description(self, img_path):
+        return self._run("generate_description", img_path)
+
+    def generate_description_stream(self, img_path):
+        return self._run_stream("generate_description", img_path)
 
-        self.img = Image.open(img_path)
+    def _generate_description_contents(self, img_path):
 
         prompt = ("Проведи тифлокомментирование по картинке, опиши её в деталях. В ответе представь только тифлокомментирование")
 
-        description = self.model_for_description.generate_content([prompt, self.img], stream=True)
-        description.resolve()
-        
-        return description.text
+        return [prompt, *prepare_image(img_path, self.image_options)]
     
     # Генерация TEI-разметки на расшифрованном тексте
     def tei_generation(self, original_text, img_path):
+        return self._run("tei_generation", original_text, img_path)
+
+    def tei_generation_stream(self, original_text, img_path):
+        return self._run_stream("tei_generation", original_text, img_path)
+
+    # Переменная часть запроса; инструкции и правила TEI — в prompt_prefix("tei_generation")
+    def _tei_generation_contents(self, original_text, img_path):
+
+        prompt = f"Расшифрованный текст: {original_text} ."
+
+        return [prompt, *prepare_image(img_path, self.image_options)]
+
+    # Полная обработка страницы с параллельным выполнением независимых этапов:
+    # OCR и тифлокомментарий зависят только от скана, ясный язык и TEI — только от OCR.
+    # Возвращает словари результатов и ошибок по названиям операций
+    def process_page(self, img_path, max_workers=4):
+
+        results, errors = {}, {}
+
+        def collect(name, future):
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            ocr_future = executor.submit(self.image_to_text, img_path)
+            desc_future = executor.submit(self.generate_description, img_path)
+
+            collect("image_to_text", ocr_future)
+            if "image_to_text" in results:
+                ocr_text = results["image_to_text"]
+                easy_future = executor.submit(self.text_easy_lang, ocr_text)
+                tei_future = executor.submit(self.tei_generation, ocr_text, img_path)
+                collect("text_easy_lang", easy_future)
+                collect("tei_generation", tei_future)
+
+            collect("generate_description", desc_future)
+
+        return results, errors
+
 
-        self.img = Image.open(img_path)
+# Общий реестр клиентов: один llm_solution на модель и параметры генерации
+_clients = {}
+_clients_lock = threading.Lock()
 
-        prompt = ("Тебе предоставлен расшифрованный текст рукописи и настоящий скан этой рукописи. "
-                  "Для расшифрованного текста представь TEI-разметку. Можешь также опираться на предоставленный скан для дополнительной валидации и информации. "
-                  "Мною был определён конкретный набор тегов и правил TEI-разметки, я хочу, чтобы ты использовал только их. " 
-                  "Если ты не можешь определить или найти какую-то информацию, удовлетворяющую тегу - то просто игнорируй его. "
-                  "Если ты уверен, что на предоставленном скане нет текста, а только какой-то рисунок или фотография - то напиши 'На данном скане текст не обнаружен...'. "
-                  f"Вот правила TEI-разметки: {TEI_rules} "
-                  f"Расшифрованный текст: {original_text} .")
+def get_llm_solution(model='gemini-1.5-flash', temperature=None, top_p=None, pres_penalty=None, freq_penalty=None):
 
-        tei = self.model.generate_content([prompt, self.img], stream=True)
-        tei.resolve()
+    key = (model, temperature, top_p, pres_penalty, freq_penalty)
 
-        return tei.text
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = llm_solution(model=model, temperature=temperature, top_p=top_p,
+                                         pres_penalty=pres_penalty, freq_penalty=freq_penalty)
+        return _clients[key]
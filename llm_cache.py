@@ -0,0 +1,150 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+# Путь к базе кэша и лимит её размера (можно переопределить через .env)
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./data/cache/llm_results.sqlite")
+DEFAULT_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+# Хэш содержимого файла (кэшируется в памяти по пути, размеру и времени изменения)
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+def file_hash(path):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    with _file_hashes_lock:
+        if memo_key in _file_hashes:
+            return _file_hashes[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+
+    with _file_hashes_lock:
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+def text_hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+# Персистентный кэш результатов LLM (SQLite) с вытеснением по размеру (LRU)
+class result_cache:
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+
+        self.path = path
+        self.max_bytes = max_bytes
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                key TEXT PRIMARY KEY,
+                                operation TEXT NOT NULL,
+                                model TEXT NOT NULL,
+                                value TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # Ключ: операция, модель, версия промпта и хэши входных данных
+    @staticmethod
+    def make_key(operation, model, prompt_version, *parts):
+        raw = "\x1f".join([operation, model, str(prompt_version), *[str(p) for p in parts]])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, operation, model, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, operation, model, value, len(value.encode("utf-8")), now, now))
+        self.evict()
+
+    # Удаление давно не использованных записей, пока размер не станет меньше лимита
+    def evict(self):
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+    # Явная инвалидация: всё, либо по операции и/или модели
+    def invalidate(self, operation=None, model=None):
+        query, params = "DELETE FROM results WHERE 1=1", []
+        if operation:
+            query += " AND operation = ?"
+            params.append(operation)
+        if model:
+            query += " AND model = ?"
+            params.append(model)
+
+        with self._connect() as conn:
+            removed = conn.execute(query, params).rowcount
+        return removed
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT operation, COUNT(*), COALESCE(SUM(size), 0) FROM results GROUP BY operation").fetchall()
+        return {operation: {"entries": count, "bytes": size} for operation, count, size in rows}
+
+
+# Общий кэш на процесс
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_cache():
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = result_cache()
+        return _shared_cache
+
+
+# Команды обслуживания кэша: python llm_cache.py stats | clear [--operation ...] [--model ...]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Кэш результатов LLM")
+    parser.add_argument("command", choices=["stats", "clear", "evict"])
+    parser.add_argument("--operation", help="image_to_text, text_easy_lang, generate_description или tei_generation")
+    parser.add_argument("--model", help="имя модели, например models/gemini-1.5-flash")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    cache = result_cache(args.path)
+
+    if args.command == "stats":
+        for operation, info in cache.stats().items():
+            print(f"{operation}: {info['entries']} записей, {info['bytes'] / 1024:.1f} КБ")
+    elif args.command == "clear":
+        print(f"Удалено записей: {cache.invalidate(args.operation, args.model)}")
+    else:
+        print(f"Вытеснено записей: {cache.evict()}")
@@ -0,0 +1,561 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlparse
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from scan_store import scan_store
+
+
+# Парсер сайта "Автограф" (literature-archive.ru): модульная версия data/manuscripts_parser.ipynb
+BASE_URL = "http://literature-archive.ru/ru"
+
+DEFAULT_OUTPUT_DIR = "./data/Authors_Manusripts/"
+DEFAULT_MANIFEST_PATH = "./data/cache/scraper_manifest.json"
+
+# Доп. путь к рукописям для авторов, у которых архив лежит не на главной странице автора
+AUTHOR_PATHS = {"Блок Александр Александрович": "/en/digital-archive/manuscripts"}
+
+
+# Ограничитель нагрузки на хост: не больше max_concurrent запросов одновременно
+# и не чаще одного начала запроса в min_interval секунд (вместо фиксированных пауз)
+class host_limiter:
+
+    def __init__(self, min_interval=0.5, max_concurrent=4):
+
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+
+        self._lock = threading.Lock()
+        self._next_start = {}
+        self._semaphores = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_concurrent))
+
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+# Манифест синхронизации: загруженные материалы и сканы (url, размер, ETag, sha256).
+# Ключи — пути относительно каталога корпуса. Каждое изменение дописывается строкой в журнал (<path>.journal),
+# поэтому прерванная загрузка продолжается с места остановки, а запись не зависит от размера корпуса;
+# журнал сворачивается в основной JSON при загрузке манифеста и когда становится длиннее самого манифеста
+class sync_manifest:
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+
+        self.path = path
+        self.journal_path = f"{path}.journal" if path else None
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
+
+        data = {}
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        self.materials = data.get("materials", {})
+        self.scans = data.get("scans", {})
+
+        # журнал сворачивается, даже если в нём только недописанная строка: иначе новые записи приклеились бы к ней
+        if path and os.path.exists(self.journal_path):
+            self._replay()
+            self.compact()
+
+    # Применить записи журнала поверх основного JSON; возвращает число применённых записей
+    def _replay(self):
+        replayed = 0
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # недописанная последняя строка (запуск прерван во время записи)
+                        break
+                    table = self.scans if record["kind"] == "scan" else self.materials
+                    if record["entry"] is None:
+                        table.pop(record["key"], None)
+                    else:
+                        table[record["key"]] = record["entry"]
+                    replayed += 1
+        except OSError:
+            pass
+        return replayed
+
+    def scan(self, key):
+        with self._lock:
+            return dict(self.scans.get(key) or {})
+
+    def material(self, key):
+        with self._lock:
+            return dict(self.materials.get(key) or {})
+
+    def put_scan(self, key, entry):
+        with self._lock:
+            if self.scans.get(key) == entry:
+                return
+            if entry is None:
+                self.scans.pop(key, None)
+            else:
+                self.scans[key] = entry
+            self._append("scan", key, entry)
+
+    def put_material(self, key, entry):
+        with self._lock:
+            if self.materials.get(key) == entry:
+                return
+            self.materials[key] = entry
+            self._append("material", key, entry)
+
+    # Полностью загруженные сканы: [(ключ, запись)]
+    def complete_scans(self):
+        with self._lock:
+            return [(k, dict(v)) for k, v in self.scans.items() if v.get("complete")]
+
+    # Материалы, чей каталог лежит внутри prefix
+    def material_keys(self, prefix):
+        with self._lock:
+            return [k for k in self.materials if k.startswith(os.path.join(prefix, ""))]
+
+    # Удалить записи материала и его сканов; возвращает ключи удалённых сканов
+    def drop_material(self, key):
+        with self._lock:
+            if self.materials.pop(key, None) is not None:
+                self._append("material", key, None)
+            removed = [k for k in self.scans if os.path.dirname(k) == key]
+            for k in removed:
+                del self.scans[k]
+                self._append("scan", k, None)
+            return removed
+
+    # Свернуть журнал в основной JSON
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    # Дописать изменение в журнал; вызывается под self._lock
+    def _append(self, kind, key, entry):
+        if not self.path:
+            return
+        if self._journal is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps({"kind": kind, "key": key, "entry": entry}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+        self._journal_records += 1
+        if self._journal_records > max(1000, len(self.scans)):
+            self._compact()
+
+    # Сначала атомарно заменяется основной JSON, потом очищается журнал:
+    # если запуск прервётся между ними, повторное применение журнала ничего не изменит
+    def _compact(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"materials": self.materials, "scans": self.scans}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_records = 0
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest
+
+
+def make_session(pool_size=16, retries=3):
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=1.0, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "HTR-inclusive-app corpus builder"
+    return session
+
+
+def handle_titles(title: str, title_counter: dict):
+    if title in title_counter:
+        title_counter[title] += 1
+        return f"{title}_{title_counter[title]}"
+
+    else:
+        title_counter[title] = 1
+        return title
+
+
+def getUniqueItems(d: dict):
+    result = {}
+    for key,value in d.items():
+        if value not in result.values():
+            result[key] = value
+    return result
+
+
+class pars_autograph:
+
+    def __init__(self, base_url=BASE_URL, username=None, password=None, workers=8, min_interval=0.5, session=None, timeout=60):
+
+        self.base_url = base_url
+        self.workers = workers
+        self.timeout = timeout
+
+        self.session = session or make_session(pool_size=max(workers, 4))
+        self.limiter = host_limiter(min_interval=min_interval, max_concurrent=max(1, workers // 2))
+
+        # Вход на сайт позволяет получить более высокое качество изображений
+        if username and password:
+            self.login(username, password)
+
+        soup = self._soup(self.base_url)
+
+        authors_corpus = soup.find("div", {"class":"main_faces"}).find_all("a", href=True)
+
+        self.authors = {}
+
+        for author in authors_corpus:
+            self.authors[author.get('title')] = urljoin(self.base_url, author.get('href'))
+
+    def _get(self, url, **kwargs):
+        with self.limiter.slot(url):
+            response = self.session.get(url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _soup(self, url):
+        return BeautifulSoup(self._get(url).text, "html.parser")
+
+    # Вход через форму логина: заполняются поля name/pass, скрытые поля формы передаются как есть
+    def login(self, username, password):
+        soup = self._soup(self.base_url)
+        field = soup.find("input", {"name": "pass"})
+        form = field.find_parent("form") if field else None
+        if form is None:
+            raise RuntimeError("Форма входа не найдена.")
+
+        data = {inp.get("name"): inp.get("value", "") for inp in form.find_all("input") if inp.get("name")}
+        data.update({"name": username, "pass": password})
+
+        action = urljoin(self.base_url, form.get("action") or self.base_url)
+        with self.limiter.slot(action):
+            self.session.post(action, data=data, timeout=self.timeout).raise_for_status()
+
+    # Список архивов автора: [(название, url)]
+    def author_archives(self, author_name):
+        author_url = self.authors[author_name]
+        url_author = self._soup(author_url + AUTHOR_PATHS.get(author_name, ""))
+
+        author_archive = url_author.find("div", {"class":"region region-sidebar-first sidebar"}).find_all("a")
+
+        return [(re.sub('"', '', archive.text).strip(), author_url + archive.get("href")) for archive in author_archive]
+
+    # Материалы архива: {уникальное имя каталога: url материала}
+    def archive_materials(self, author_name, archive_url):
+        url_archive = self._soup(archive_url)
+
+        view = url_archive.find("div", {"id":"content"}).find("div", {"class":"view-content"})
+        if not view:
+            return {}
+
+        material_urls = [(self.authors[author_name] + m_url.get("href")) for m_url in view.find_all("a", {"class":"language-link"})]
+
+        title_counter = {}
+
+        material_titles = [handle_titles(m_title.get("title").strip(), title_counter) for m_title in view.find_all("a", {"rel":"tag"})]
+
+        materials = getUniqueItems(dict(zip(material_titles, material_urls)))
+
+        title_counter.clear()
+
+        result = {}
+        for title, material in materials.items():
+            title_formated = re.sub(r'[\\/*?:"<>|]', '', title)[:85].strip()
+            result[handle_titles(title_formated, title_counter)] = material
+        return result
+
+    # Страница материала: метаданные (DataFrame) и ссылки на сканы
+    def material(self, material_url):
+        content = self._soup(material_url)
+        block = content.find("div", {"id":"block-system-main"})
+
+        meta_titles = [mark.text for mark in block.find_all("h2")]
+        meta_titles.append("Описание: ")
+
+        meta_inf = [inf.text for inf in block.find_all("div", {"class":"field-item even"})[1:]]
+
+        meta_data = pd.DataFrame([dict(zip(meta_titles, meta_inf))]).T
+
+        scan_urls = [urljoin(material_url, scan.get("href")) for scan in block.find_all("a")
+                     if scan.get("href") and len(scan.get("href")) > 50]
+
+        return meta_data, scan_urls
+
+    # Потоковая загрузка скана на диск через временный файл .part.
+    # known — запись манифеста о предыдущей загрузке: по ней неизменённый скан пропускается
+    # (или проверяется условным запросом при revalidate), а недокачанный — докачивается через Range.
+    # on_start(entry) вызывается до записи тела, чтобы ETag недокачанного файла попал в манифест.
+    # Возвращает (запись, изменение), изменение — None, "added" или "modified"
+    def download_scan(self, url, path, known=None, revalidate=False, on_start=None):
+        known = known if known and known.get("url") == url else {}
+        tmp_path = f"{path}.part"
+        headers = {}
+
+        # stored_size отличается от size, если скан был пережат при сохранении (см. scan_store)
+        if known.get("complete") and os.path.isfile(path) and os.path.getsize(path) == known.get("stored_size", known.get("size")):
+            if not revalidate or not known.get("etag"):
+                return known, None
+            headers["If-None-Match"] = known["etag"]
+        elif known.get("etag") and os.path.isfile(tmp_path):
+            headers["Range"] = f"bytes={os.path.getsize(tmp_path)}-"
+            headers["If-Range"] = known["etag"]
+
+        with self.limiter.slot(url):
+            response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+            if response.status_code == 416 and "Range" in headers:
+                # .part уже не короче файла на сервере (докачан целиком до обрыва записи манифеста):
+                # продолжать нечего, скан загружается заново
+                response.close()
+                os.remove(tmp_path)
+                del headers["Range"], headers["If-Range"]
+                response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+
+            with response:
+                if response.status_code == 304:
+                    return known, None
+                response.raise_for_status()
+
+                etag = response.headers.get("ETag")
+                if response.status_code == 206:
+                    digest, size, mode = _sha256_file(tmp_path), os.path.getsize(tmp_path), "ab"
+                else:
+                    digest, size, mode = hashlib.sha256(), 0, "wb"
+
+                entry = {"url": url, "etag": etag, "complete": False}
+                if on_start:
+                    on_start(entry)
+
+                with open(tmp_path, mode) as f:
+                    for block in response.iter_content(chunk_size=1 << 16):
+                        f.write(block)
+                        digest.update(block)
+                        size += len(block)
+
+        entry.update({"size": size, "sha256": digest.hexdigest(), "complete": True})
+
+        # тот же контент не перезаписывается: mtime скана сохраняется, и индексы/кэши приложения его не трогают
+        previous = known.get("sha256") if known.get("complete") else None
+        if previous is None and os.path.isfile(path):
+            previous = _sha256_file(path).hexdigest()
+        if previous == entry["sha256"]:
+            os.remove(tmp_path)
+            return entry, None
+
+        change = "modified" if os.path.isfile(path) else "added"
+        os.replace(tmp_path, path)
+        return entry, change
+
+    # Синхронизация материала: метаданные переписываются только при изменении, сканы — по манифесту
+    def _sync_material(self, executor, root, folder_key, material_url, manifest, revalidate, prune, store):
+        folder = os.path.join(root, folder_key)
+        os.makedirs(folder, exist_ok=True)
+        changes = []
+
+        meta_data, scan_urls = self.material(material_url)
+
+        meta_path = os.path.join(folder, "meta_data.xlsx")
+        meta_hash = hashlib.sha256(meta_data.to_json(force_ascii=False).encode("utf-8")).hexdigest()
+        known = manifest.material(folder_key)
+        if known.get("meta_hash") != meta_hash or not os.path.isfile(meta_path):
+            change = "modified" if os.path.isfile(meta_path) else "added"
+            with pd.ExcelWriter(meta_path) as writer:
+                meta_data.to_excel(writer)
+            changes.append((change, meta_path))
+
+        # сканы, которых больше нет на странице материала
+        for counter in range(len(scan_urls) + 1, known.get("scans", 0) + 1):
+            scan_key = os.path.join(folder_key, f"{counter}.png")
+            scan_path = os.path.join(root, scan_key)
+            if os.path.isfile(scan_path):
+                if prune:
+                    os.remove(scan_path)
+                changes.append(("removed", scan_path))
+            manifest.put_scan(scan_key, None)
+
+        manifest.put_material(folder_key, {"url": material_url, "meta_hash": meta_hash, "scans": len(scan_urls)})
+
+        def sync_scan(scan_key, url):
+            scan_path = os.path.join(root, scan_key)
+            entry, change = self.download_scan(url, scan_path, manifest.scan(scan_key), revalidate,
+                                               on_start=lambda partial: manifest.put_scan(scan_key, partial))
+            if change and store is not None:
+                store.ingest(scan_path, entry["sha256"])
+            # размер файла на диске записывается и для скана, перезагруженного без изменений:
+            # иначе пережатый файл не совпал бы с size, и скан загружался бы заново при каждом запуске
+            if store is not None and os.path.isfile(scan_path):
+                entry["stored_size"] = os.path.getsize(scan_path)
+            manifest.put_scan(scan_key, entry)
+            return [(change, scan_path)] if change else []
+
+        futures = [executor.submit(sync_scan, os.path.join(folder_key, f"{counter}.png"), url)
+                   for counter, url in enumerate(scan_urls, start=1)]
+        return changes, futures
+
+    # Инкрементальная загрузка всех архивов автора: новые и изменённые материалы и сканы загружаются
+    # параллельно, неизменённые пропускаются, недокачанные докачиваются.
+    # Если передан store (scan_store), одинаковые сканы сохраняются один раз (жёсткими ссылками).
+    # Возвращает (изменения, ошибки); изменения — список (added/modified/removed, путь к файлу)
+    def pars_author(self, author_name, parent_directory=DEFAULT_OUTPUT_DIR, manifest=None, revalidate=False, prune=False,
+                    store=None):
+
+        manifest = manifest if manifest is not None else sync_manifest(None)
+        if store is not None:
+            for scan_key, entry in manifest.complete_scans():
+                store.register(entry["sha256"], os.path.join(parent_directory, scan_key))
+        os.makedirs(os.path.join(parent_directory, author_name), exist_ok=True)
+
+        changes, failed = [], []
+        seen = set()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            material_futures = {}
+            for archive_name, archive_url in self.author_archives(author_name):
+                try:
+                    materials = self.archive_materials(author_name, archive_url)
+                except Exception as e:
+                    failed.append(f"{archive_url}: {e}")
+                    # материалы архива, который не удалось получить, не считаются удалёнными
+                    seen.update(manifest.material_keys(os.path.join(author_name, archive_name)))
+                    continue
+                for unique_title, material_url in materials.items():
+                    folder_key = os.path.join(author_name, archive_name, unique_title)
+                    seen.add(folder_key)
+                    future = executor.submit(self._sync_material, executor, parent_directory, folder_key,
+                                             material_url, manifest, revalidate, prune, store)
+                    material_futures[future] = material_url
+
+            scan_futures = []
+            for future in as_completed(material_futures):
+                try:
+                    material_changes, futures = future.result()
+                    changes.extend(material_changes)
+                    scan_futures.extend(futures)
+                except Exception as e:
+                    failed.append(f"{material_futures[future]}: {e}")
+
+            for future in as_completed(scan_futures):
+                try:
+                    changes.extend(future.result())
+                except Exception as e:
+                    failed.append(str(e))
+
+        # материалы, исчезнувшие с сайта
+        for folder_key in [k for k in manifest.material_keys(author_name) if k not in seen]:
+            folder = os.path.join(parent_directory, folder_key)
+            for scan_key in manifest.drop_material(folder_key):
+                changes.append(("removed", os.path.join(parent_directory, scan_key)))
+            changes.append(("removed", os.path.join(folder, "meta_data.xlsx")))
+            if prune:
+                shutil.rmtree(folder, ignore_errors=True)
+
+        manifest.compact()
+        return changes, failed
+
+
+# Обновить индексы приложения после синхронизации (каталог сканов и поисковый индекс по метаданным)
+def reindex(root=DEFAULT_OUTPUT_DIR):
+    from catalog import catalog_index
+    from metadata_store import get_store
+    from search_index import search_index
+
+    catalog = catalog_index(root)
+    catalog.refresh(force=True)
+    store = get_store()
+    index = search_index(catalog, lambda author, archive_type, archive: store.load(
+        os.path.join(root, author, archive_type, archive, "meta_data.xlsx")))
+    index.update()
+
+
+# Загрузка и синхронизация корпуса: python manuscripts_parser.py "Пастернак Борис Леонидович" ... [--workers 8]
+# Повторный запуск загружает только новое и изменившееся; список изменений — в --changes
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Загрузка автографов с сайта literature-archive.ru")
+    parser.add_argument("authors", nargs="*", help="имена авторов как на сайте; без аргументов выводится список авторов")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--changes", help="файл JSON со списком изменений (для переиндексации и пакетной обработки)")
+    parser.add_argument("--revalidate", action="store_true", help="проверять ранее загруженные сканы условным запросом по ETag")
+    parser.add_argument("--prune", action="store_true", help="удалять с диска материалы и сканы, исчезнувшие с сайта")
+    parser.add_argument("--reindex", action="store_true", help="после загрузки обновить каталог и поисковый индекс")
+    parser.add_argument("--no-dedup", action="store_true", help="не заменять одинаковые сканы жёсткими ссылками")
+    parser.add_argument("--recompress", action="store_true", help="пережимать загруженные PNG без потерь")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--min-interval", type=float, default=0.5, help="минимальный интервал между запросами к одному хосту, с")
+    parser.add_argument("--username", default=os.getenv("AUTOGRAPH_USERNAME"))
+    parser.add_argument("--password", default=os.getenv("AUTOGRAPH_PASSWORD"))
+    args = parser.parse_args()
+
+    autograph = pars_autograph(args.base_url, args.username, args.password, args.workers, args.min_interval)
+
+    if not args.authors:
+        print("\n".join(autograph.authors))
+
+    manifest = sync_manifest(args.manifest)
+    store = None if args.no_dedup else scan_store(args.recompress)
+    all_changes, all_failed = [], []
+    for author in args.authors:
+        changes, failed = autograph.pars_author(author, args.output, manifest, args.revalidate, args.prune, store)
+        all_changes.extend(changes)
+        all_failed.extend(failed)
+        counts = {kind: sum(1 for change, _ in changes if change == kind) for kind in ("added", "modified", "removed")}
+        print(f"{author}: новых {counts['added']}, изменённых {counts['modified']}, удалённых {counts['removed']}, ошибок {len(failed)}")
+
+    if store is not None and (store.linked or store.saved_bytes):
+        print(f"Дубликатов заменено ссылками: {store.linked}, сэкономлено: {store.saved_bytes / 1024 / 1024:.1f} МБ")
+
+    if args.changes:
+        with open(args.changes, "w", encoding="utf-8") as f:
+            json.dump([{"change": change, "path": path} for change, path in all_changes], f, ensure_ascii=False, indent=1)
+
+    if args.reindex and all_changes:
+        reindex(args.output)
+
+    raise SystemExit(1 if all_failed else 0)
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# Каталог с бинарными копиями meta_data.xlsx
+DEFAULT_STORE_DIR = "./data/cache/metadata"
+
+META_FILENAME = "meta_data.xlsx"
+
+
+# Хранилище метаданных: каждый meta_data.xlsx один раз конвертируется в pickle-файл
+# и перечитывается из Excel только при изменении mtime или размера исходника
+class metadata_store:
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, memory_items=256):
+
+        self.store_dir = store_dir
+        self.memory_items = memory_items
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # LRU в памяти: путь -> (подпись исходника, DataFrame)
+
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _cache_path(self, meta_path):
+        name = hashlib.sha1(os.path.abspath(meta_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.store_dir, f"{name}.pkl")
+
+    def _remember(self, meta_path, signature, frame):
+        with self._lock:
+            self._memory[meta_path] = (signature, frame)
+            self._memory.move_to_end(meta_path)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # Загрузка метаданных; None, если файла нет или его не удалось прочитать
+    def load(self, meta_path):
+        try:
+            stat = os.stat(meta_path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._memory.get(meta_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        cache_path = self._cache_path(meta_path)
+        try:
+            with open(cache_path, "rb") as f:
+                stored_signature, frame = pickle.load(f)
+            if stored_signature == signature:
+                self._remember(meta_path, signature, frame)
+                return frame
+        except Exception:
+            # повреждённый или несовместимый кэш (в т.ч. записанный другой версией pandas) пересоздаётся из xlsx
+            pass
+
+        return self.convert(meta_path, signature)
+
+    # Конвертация одного xlsx в бинарный формат
+    def convert(self, meta_path, signature=None):
+        try:
+            if signature is None:
+                stat = os.stat(meta_path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            frame = pd.read_excel(meta_path, index_col=0)
+        except Exception:
+            return None
+
+        cache_path = self._cache_path(meta_path)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((signature, frame), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+
+        self._remember(meta_path, signature, frame)
+        return frame
+
+    # Массовая конвертация всего корпуса
+    def convert_all(self, root):
+        converted = 0
+        for dirpath, _, filenames in os.walk(root):
+            if META_FILENAME in filenames:
+                if self.load(os.path.join(dirpath, META_FILENAME)) is not None:
+                    converted += 1
+        return converted
+
+
+# Общее хранилище на процесс
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+def get_store():
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = metadata_store()
+        return _shared_store
+
+
+# Массовая конвертация: python metadata_store.py [--root ...]
+if __name__ == "__main__":
+    import argparse
+
+    from catalog import DATASET_DIR
+
+    parser = argparse.ArgumentParser(description="Конвертация meta_data.xlsx в бинарный формат")
+    parser.add_argument("--root", default=DATASET_DIR)
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    args = parser.parse_args()
+
+    print(f"Сконвертировано файлов метаданных: {metadata_store(args.store).convert_all(args.root)}")
@@ -0,0 +1,130 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Журнал вызовов (JSON Lines) и файл с агрегированными метриками в текстовом формате Prometheus.
+# Пустой METRICS_LOG отключает журнал; при превышении METRICS_LOG_MAX_MB журнал переименовывается в <log>.1
+# (предыдущий .1 удаляется), так что на диске не больше двух файлов журнала. 0 — без ротации
+METRICS_LOG = os.getenv("METRICS_LOG", "./data/cache/metrics.jsonl")
+METRICS_LOG_MAX_BYTES = int(float(os.getenv("METRICS_LOG_MAX_MB", "50")) * 1024 * 1024)
+METRICS_FILE = os.getenv("METRICS_FILE", "./data/cache/metrics.prom")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/cache/profiles")
+
+# Файл метрик перезаписывается не чаще, чем раз в N секунд
+METRICS_FILE_INTERVAL = 5.0
+
+_lock = threading.Lock()
+_totals = defaultdict(lambda: defaultdict(float))  # (kind, operation, model) -> счётчики
+_last_flush = 0.0
+
+
+# Сохранить запись о вызове: в журнал и в агрегаты
+def record(kind, **fields):
+    global _last_flush
+
+    entry = {"ts": time.time(), "kind": kind, **{k: v for k, v in fields.items() if v is not None}}
+    labels = (kind, str(fields.get("operation", "")), str(fields.get("model", "")))
+
+    with _lock:
+        totals = _totals[labels]
+        totals["calls"] += 1
+        totals["wall_seconds"] += fields.get("wall_time") or 0.0
+        for name in ("prompt_tokens", "response_tokens", "image_bytes", "audio_seconds"):
+            totals[name] += fields.get(name) or 0
+        if fields.get("cache") in ("hit", "miss"):
+            totals[f"cache_{fields['cache']}"] += 1
+        if fields.get("error"):
+            totals["errors"] += 1
+
+        try:
+            if METRICS_LOG:
+                _append_log(entry)
+
+            if time.monotonic() - _last_flush > METRICS_FILE_INTERVAL:
+                _write_metrics_file()
+                _last_flush = time.monotonic()
+        except OSError:
+            pass
+
+    return entry
+
+
+# Дописать запись в журнал с ротацией по размеру; вызывается под _lock
+def _append_log(entry):
+    os.makedirs(os.path.dirname(os.path.abspath(METRICS_LOG)), exist_ok=True)
+    with open(METRICS_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        size = f.tell()
+    if METRICS_LOG_MAX_BYTES and size >= METRICS_LOG_MAX_BYTES:
+        os.replace(METRICS_LOG, f"{METRICS_LOG}.1")
+
+
+# Агрегированные метрики в текстовом формате Prometheus
+def render_metrics():
+    with _lock:
+        return _render()
+
+
+def _render():
+    lines = []
+    for (kind, operation, model), totals in sorted(_totals.items()):
+        labels = f'kind="{kind}",operation="{operation}",model="{model}"'
+        for name, value in sorted(totals.items()):
+            lines.append(f"htr_{name}_total{{{labels}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_metrics_file():
+    os.makedirs(os.path.dirname(os.path.abspath(METRICS_FILE)), exist_ok=True)
+    tmp_path = f"{METRICS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_render())
+    os.replace(tmp_path, METRICS_FILE)
+
+
+# Локальная HTTP-точка для сбора метрик: GET /metrics
+def start_metrics_server(port=9108, host="127.0.0.1"):
+
+    class handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+# Профилирование блока кода через cProfile (включается переменной окружения PROFILE_RENDER=1)
+@contextmanager
+def profile_block(name, enabled=None):
+    if enabled is None:
+        enabled = os.getenv("PROFILE_RENDER") == "1"
+    if not enabled:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9}.prof"))
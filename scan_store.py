@@ -0,0 +1,163 @@
+import argparse
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+
+# Хранение сканов без дублей: одинаковые по содержимому сканы разных материалов
+# становятся жёсткими ссылками на один файл; PNG при желании пережимаются без потерь.
+# Пути вида .../{n}.png не меняются, поэтому catalog.get_image_paths и всё остальное работают как прежде
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Пережать PNG без потерь (optimize) с сохранением разрешения (pHYs), текстовых чанков, ICC-профиля и EXIF:
+# по dpi выгрузка в PDF задаёт физический размер страницы. Файл заменяется, только если он стал меньше,
+# а пиксели и метаданные совпадают; PNG с чанками, которые Pillow не записывает (например, gAMA), не трогаются.
+# Файлы с несколькими жёсткими ссылками не трогаются, чтобы не разрывать общий экземпляр.
+# Возвращает число сэкономленных байт
+def compact_png(path):
+    stat = os.stat(path)
+    if stat.st_nlink > 1:
+        return 0
+    size = stat.st_size
+    try:
+        with Image.open(path) as img:
+            if img.format != "PNG":
+                return 0
+            img.load()
+
+            pnginfo = PngInfo()
+            for key, value in img.text.items():
+                pnginfo.add_text(key, value)
+            options = {key: img.info[key] for key in ("dpi", "icc_profile", "exif", "transparency") if key in img.info}
+
+            buf = io.BytesIO()
+            img.save(buf, format="PNG", optimize=True, pnginfo=pnginfo, **options)
+            if buf.tell() >= size:
+                return 0
+
+            buf.seek(0)
+            with Image.open(buf) as packed:
+                packed.load()
+                if packed.mode != img.mode or packed.size != img.size or packed.tobytes() != img.tobytes():
+                    return 0
+                if packed.info != img.info or packed.text != img.text:
+                    return 0
+    except OSError:
+        return 0
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp_path, path)
+    return size - os.path.getsize(path)
+
+
+# Заменить path жёсткой ссылкой на target (через временное имя, чтобы path не пропадал)
+def _link(target, path):
+    tmp_path = f"{path}.link"
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.link(target, tmp_path)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        # файловая система без жёстких ссылок или другой том: остаётся отдельная копия
+        return False
+
+
+class scan_store:
+
+    def __init__(self, recompress=False):
+
+        self.recompress = recompress
+
+        self._lock = threading.Lock()
+        self._paths = {}   # sha256 исходного содержимого -> путь к хранимому экземпляру
+        self._shas = {}    # абсолютный путь -> sha256 содержимого, которое по нему лежит
+        self.linked = 0
+        self.saved_bytes = 0
+
+    # Запомнить, что по path теперь лежит содержимое sha256. Если path был хранимым экземпляром
+    # другого содержимого (скан перезагружен с новым контентом), старая запись удаляется,
+    # чтобы следующий дубль не стал ссылкой на файл с чужим содержимым. Вызывается под self._lock
+    def _assign(self, sha256, path):
+        key = os.path.abspath(path)
+        previous = self._shas.get(key)
+        if previous is not None and previous != sha256:
+            stored = self._paths.get(previous)
+            if stored is not None and os.path.abspath(stored) == key:
+                del self._paths[previous]
+        self._shas[key] = sha256
+
+    # Зарегистрировать уже хранимый скан (например, из манифеста загрузчика)
+    def register(self, sha256, path):
+        with self._lock:
+            self._assign(sha256, path)
+            self._paths.setdefault(sha256, path)
+
+    # Принять загруженный скан: дубль становится жёсткой ссылкой на хранимый экземпляр,
+    # новый скан при recompress пережимается. Возвращает "linked" или "stored".
+    # Если дубль приходит, пока первый экземпляр ещё пережимается, ссылка может указать на старую копию:
+    # содержимое при этом верное, теряется только экономия места
+    def ingest(self, path, sha256):
+        with self._lock:
+            self._assign(sha256, path)
+            target = self._paths.get(sha256)
+            # хранимый экземпляр должен по-прежнему содержать именно это содержимое
+            if target is not None and self._shas.get(os.path.abspath(target)) != sha256:
+                target = None
+            if target is None or not os.path.isfile(target):
+                self._paths[sha256] = path
+                target = None
+
+        if target is not None and os.path.abspath(target) != os.path.abspath(path):
+            if os.path.samefile(target, path):
+                return "linked"
+            size = os.path.getsize(path)
+            if _link(target, path):
+                with self._lock:
+                    self.linked += 1
+                    self.saved_bytes += size
+                return "linked"
+
+        if self.recompress:
+            saved = compact_png(path)
+            with self._lock:
+                self.saved_bytes += saved
+        return "stored"
+
+
+# Дедупликация уже загруженного корпуса: python scan_store.py [--root ...] [--recompress]
+def dedup_tree(root, recompress=False):
+    store = scan_store(recompress)
+    for folder, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith(".png"):
+                path = os.path.join(folder, name)
+                store.ingest(path, _sha256_file(path))
+    return store
+
+
+if __name__ == "__main__":
+    from catalog import DATASET_DIR
+
+    parser = argparse.ArgumentParser(description="Дедупликация и сжатие сканов корпуса")
+    parser.add_argument("--root", default=DATASET_DIR)
+    parser.add_argument("--recompress", action="store_true", help="пережать PNG без потерь")
+    args = parser.parse_args()
+
+    store = dedup_tree(args.root, args.recompress)
+    print(f"Заменено ссылками: {store.linked}, освобождено: {store.saved_bytes / 1024 / 1024:.1f} МБ")
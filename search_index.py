@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+from collections import defaultdict
+
+
+# Путь к сохранённому индексу поиска
+DEFAULT_INDEX_PATH = "./data/cache/search_index.json"
+
+INDEX_VERSION = 1
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Триграммный индекс по тексту метаданных архивов.
+# Семантика поиска как раньше: запрос ищется как подстрока в meta.to_string().lower()
+class search_index:
+
+    def __init__(self, catalog, load_metadata, index_path=DEFAULT_INDEX_PATH):
+
+        self.catalog = catalog
+        self.load_metadata = load_metadata  # (author, archive_type, archive) -> DataFrame или None
+        self.index_path = index_path
+
+        self._lock = threading.RLock()
+        self._docs = {}                      # (author, archive_type, archive) -> {"mtime": ..., "text": ...}
+        self._postings = defaultdict(set)    # триграмма -> множество ключей архивов
+
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") != INDEX_VERSION or saved.get("root") != os.path.abspath(self.catalog.root):
+                return
+            for author, archive_type, archive, mtime, text in saved["docs"]:
+                self._add((author, archive_type, archive), mtime, text)
+        except (OSError, ValueError, KeyError):
+            self._docs.clear()
+            self._postings.clear()
+
+    def save(self):
+        with self._lock:
+            docs = [[*key, doc["mtime"], doc["text"]] for key, doc in self._docs.items()]
+            saved = {"version": INDEX_VERSION, "root": os.path.abspath(self.catalog.root), "docs": docs}
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(saved, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+
+    def _add(self, key, mtime, text):
+        self._docs[key] = {"mtime": mtime, "text": text}
+        if text:
+            for gram in _trigrams(text):
+                self._postings[gram].add(key)
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc and doc["text"]:
+            for gram in _trigrams(doc["text"]):
+                self._postings[gram].discard(key)
+                if not self._postings[gram]:
+                    del self._postings[gram]
+
+    def _metadata_text(self, key):
+        meta = self.load_metadata(*key)
+        if meta is None:
+            return None
+        try:
+            return meta.to_string().lower()
+        except AttributeError:
+            return None
+
+    # Инкрементальное обновление: переиндексируются только архивы, у которых изменился meta_data.xlsx
+    def update(self):
+        with self._lock:
+            seen = set()
+            changed = False
+
+            for key in self.catalog.iter_archives():
+                seen.add(key)
+                info = self.catalog.archive_info(*key)
+                mtime = info["meta_mtime"] if info else None
+
+                doc = self._docs.get(key)
+                if doc is not None and doc["mtime"] == mtime:
+                    continue
+
+                self._remove(key)
+                self._add(key, mtime, self._metadata_text(key) if mtime is not None else None)
+                changed = True
+
+            for key in set(self._docs) - seen:
+                self._remove(key)
+                changed = True
+
+            if changed:
+                self.save()
+
+    # Поиск: возвращает архивы, в метаданных которых есть подстрока query,
+    # отсортированные по числу вхождений. Пустой запрос возвращает все архивы с метаданными
+    def search(self, query, author=None, archive_type=None):
+        self.update()
+        query = (query or "").lower()
+
+        with self._lock:
+            if len(query) >= 3:
+                grams = sorted(_trigrams(query), key=lambda gram: len(self._postings.get(gram, ())))
+                candidates = set(self._postings.get(grams[0], ()))
+                for gram in grams[1:]:
+                    if not candidates:
+                        break
+                    candidates &= self._postings.get(gram, set())
+            else:
+                candidates = set(self._docs)
+
+            results = []
+            for key in candidates:
+                if author and key[0] != author:
+                    continue
+                if archive_type and key[1] != archive_type:
+                    continue
+                text = self._docs[key]["text"]
+                if text is None or query not in text:
+                    continue
+                results.append((text.count(query) if query else 0, key))
+
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return [{"author": key[0], "archive_type": key[1], "archive": key[2]} for _, key in results]
@@ -0,0 +1,116 @@
+import hashlib
+import io
+import os
+import time
+import wave
+
+import numpy as np
+
+
+# Дисковый кэш озвученных описаний: WAV int16 (в 2 раза компактнее float32), общий для всех сессий
+# и для пакетной обработки. Модуль не зависит от torch, поэтому проверка кэша не загружает модели
+SPEECH_DIR = os.getenv("SPEECH_CACHE_DIR", "./data/cache/speech")
+SPEECH_CACHE_MAX_BYTES = int(os.getenv("SPEECH_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+MODEL_NAME = "utrobinmv/tts_ru_free_hf_vits_low_multispeaker"
+
+
+# Кодирование float-волны в WAV (int16) для скачивания и кэширования
+def to_wav_bytes(waveform, sampling_rate):
+    pcm = (np.clip(np.asarray(waveform, dtype=np.float32), -1.0, 1.0) * 32767).astype('<i2')
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(int(sampling_rate))
+        wav_file.writeframes(pcm.tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+# Путь к файлу озвучки: ключ — хэш текста, голос, seed и модель
+def speech_path(text, speaker=0, seed=555, model_name=MODEL_NAME, speech_dir=SPEECH_DIR):
+    name = hashlib.sha256(f"{model_name}|{speaker}|{seed}|{text}".encode("utf-8")).hexdigest()
+    return os.path.join(speech_dir, name[:2], f"{name}.wav")
+
+
+# Путь к сохранённой озвучке или None; обращение обновляет время файла (для вытеснения давно не использованных)
+def cached_speech_path(text, speaker=0, seed=555, model_name=MODEL_NAME, speech_dir=SPEECH_DIR):
+    path = speech_path(text, speaker, seed, model_name, speech_dir)
+    if not os.path.isfile(path):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return path
+
+
+# Сохранить озвучку на диск, чтобы её могли переиспользовать все сессии приложения и пакетная обработка
+def save_speech(text, waveform, sampling_rate, speaker=0, seed=555, model_name=MODEL_NAME, speech_dir=SPEECH_DIR):
+    path = speech_path(text, speaker, seed, model_name, speech_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(to_wav_bytes(waveform, sampling_rate).getvalue())
+    os.replace(tmp_path, path)
+
+    evict(speech_dir)
+    return path
+
+
+# Прочитать сохранённую озвучку: (волна float32, частота дискретизации) или None
+def load_speech(text, speaker=0, seed=555, model_name=MODEL_NAME, speech_dir=SPEECH_DIR):
+    path = cached_speech_path(text, speaker, seed, model_name, speech_dir)
+    if path is None:
+        return None
+
+    with wave.open(path, 'rb') as wav_file:
+        sampling_rate = wav_file.getframerate()
+        pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+    return pcm.astype(np.float32) / 32767, sampling_rate
+
+
+# Удаление давно не использованных файлов, пока размер каталога больше лимита
+def evict(speech_dir=SPEECH_DIR, max_bytes=SPEECH_CACHE_MAX_BYTES):
+    files = []
+    for folder, _, names in os.walk(speech_dir):
+        for name in names:
+            if name.endswith(".wav"):
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+# Статистика кэша: python speech_cache.py
+if __name__ == "__main__":
+    count = size = 0
+    oldest = None
+    for folder, _, names in os.walk(SPEECH_DIR):
+        for name in names:
+            if name.endswith(".wav"):
+                stat = os.stat(os.path.join(folder, name))
+                count += 1
+                size += stat.st_size
+                oldest = min(oldest or stat.st_mtime, stat.st_mtime)
+    print(f"Файлов: {count}, размер: {size / 1024 / 1024:.1f} МБ, лимит: {SPEECH_CACHE_MAX_BYTES / 1024 / 1024:.0f} МБ")
+    if oldest:
+        print(f"Самый давний доступ: {time.strftime('%Y-%m-%d %H:%M', time.localtime(oldest))}")
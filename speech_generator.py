@@ -1,28 +1,281 @@
+import gc
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
 from transformers import VitsModel, AutoTokenizer, set_seed
 import torch
 from ruaccent import RUAccent
 
+from accent_cache import DEFAULT_ACCENT_CACHE_PATH, accent_cache
+from metrics import record
+from speech_cache import MODEL_NAME
 
-def generate_speech(image_description: str, device='cpu', speaker=0, seed=555):   # speaker: 0-woman, 1-man
+# Граница предложения: знак конца предложения и пробел после него
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+# Разбиение текста на предложения для потокового синтеза
+def split_sentences(text: str):
+    text = re.sub(r'\s+', ' ', text).strip()
+    return [s for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+# Настройки инференса на CPU (можно переопределить через .env):
+# число потоков для операций torch, динамическое квантование int8 и torch.compile
+TTS_THREADS = int(os.getenv("TTS_THREADS", "0")) or None
+TTS_QUANTIZE = os.getenv("TTS_QUANTIZE") == "1"
+TTS_COMPILE = os.getenv("TTS_COMPILE") == "1"
+
+
+# Движок синтеза речи: модель, токенизатор и RUAccent загружаются один раз на процесс.
+# threads — число потоков torch (глобальная настройка процесса), quantize — динамическое квантование
+# линейных слоёв VITS в int8 (только CPU), compile — torch.compile с возвратом к обычному режиму при ошибке.
+# accent_cache_path — файл кэша ударений (None — только в памяти процесса)
+class tts_engine:
+
+    def __init__(self, model_name=MODEL_NAME, device='cpu', threads=None, quantize=False, compile=False,
+                 accent_cache_path=DEFAULT_ACCENT_CACHE_PATH):
+
+        self.model_name = model_name
+        self.device = device
+        self.threads = threads
+        self.quantize = quantize and device == 'cpu'
+        self.compile = compile
+        self.accent_cache_path = accent_cache_path
+
+        self.model = None
+        self._eager_model = None
+        self.tokenizer = None
+        self.accentizer = None
+        self.accents = None
+
+        # set_seed глобальный, поэтому загрузка и инференс выполняются под одной блокировкой
+        self._lock = threading.RLock()
+
+    # Краткое описание режима инференса для метрик и замеров, например "int8+compile+threads=4"
+    @property
+    def variant(self):
+        parts = (["int8"] if self.quantize else []) + (["compile"] if self.compile else [])
+        parts += [f"threads={self.threads}"] if self.threads else []
+        return "+".join(parts) or "default"
+
+    @property
+    def is_loaded(self):
+        return self.model is not None
+
+    def load(self):
+
+        with self._lock:
+            if self.is_loaded:
+                return self
+
+            if self.threads:
+                torch.set_num_threads(self.threads)
+
+            model = VitsModel.from_pretrained(self.model_name).to(self.device)
+            model.eval()
+
+            if self.quantize:
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+            eager_model = model
+            if self.compile and hasattr(torch, "compile"):
+                try:
+                    model = torch.compile(model, dynamic=True)
+                except Exception:
+                    model = eager_model
+
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+
+            # load accentizer
+            accentizer = RUAccent()
+            accentizer.load(omograph_model_size='turbo', use_dictionary=True, device=self.device)
+
+            # ударения кэшируются по предложениям; версия и настройки RUAccent входят в ключ
+            try:
+                from importlib.metadata import version
+                ruaccent_version = version("ruaccent")
+            except Exception:
+                ruaccent_version = "unknown"
+            accents = accent_cache(accentizer, variant=f"ruaccent-{ruaccent_version}|turbo|dictionary",
+                                   path=self.accent_cache_path)
+
+            self.model, self.tokenizer, self.accentizer, self.accents = model, tokenizer, accentizer, accents
+            self._eager_model = eager_model
+
+        return self
+
+    # Прямой проход модели; если скомпилированная модель не справилась с входом, дальше используется обычная
+    def _forward(self, inputs, speaker):
+        with torch.inference_mode():
+            try:
+                return self.model(**inputs.to(self.device), speaker_id=speaker)
+            except Exception:
+                if self.model is self._eager_model:
+                    raise
+                self.model = self._eager_model
+                return self.model(**inputs.to(self.device), speaker_id=speaker)
+
+    def unload(self):
+
+        with self._lock:
+            self.model = None
+            self._eager_model = None
+            self.tokenizer = None
+            self.accentizer = None
+            self.accents = None
+
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    @property
+    def sampling_rate(self):
+        return self.load()._eager_model.config.sampling_rate
+
+    # Синтез с записью метрик (время, длительность аудио, коэффициент реального времени)
+    def synthesize(self, text: str, speaker=0, seed=555):   # speaker: 0-woman, 1-man
+
+        stats = {"operation": "synthesize", "model": self.model_name, "device": self.device, "variant": self.variant,
+                 "chars": len(text)}
+        started = time.perf_counter()
+
+        try:
+            output, sampling_rate = self._synthesize(text, speaker, seed)
+            stats["audio_seconds"] = len(output) / sampling_rate
+            return output, sampling_rate
+        except Exception as e:
+            stats["error"] = repr(e)
+            raise
+        finally:
+            _record_tts(stats, time.perf_counter() - started)
+
+    def _synthesize(self, text, speaker, seed):
+
+        with self._lock:
+            self.load()
 
-    set_seed(seed)  # make deterministic
+            set_seed(seed)  # make deterministic
 
-    model_name = "utrobinmv/tts_ru_free_hf_vits_low_multispeaker"
+            text = " ".join(self.accents.accent_sentences(split_sentences(text)))
 
-    model = VitsModel.from_pretrained(model_name).to(device)
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model.eval()
+            inputs = self.tokenizer(text, return_tensors="pt")
+
+            output = self._forward(inputs, speaker).waveform
+            output = output.detach().cpu().numpy().squeeze() # .squeeze() удаляет лишние измерения
+
+            return output, self.sampling_rate
+
+    # Синтез пакета предложений за один проход модели
+    def _synthesize_batch(self, sentences, speaker, seed):
+
+        with self._lock:
+            self.load()
+
+            set_seed(seed)
+
+            texts = self.accents.accent_sentences(sentences)
+
+            inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+
+            result = self._forward(inputs, speaker)
+
+            waveforms = result.waveform.detach().cpu().numpy()
+            lengths = result.sequence_lengths.detach().cpu().numpy() if result.sequence_lengths is not None else None
+
+            # обрезка паддинга у каждого предложения пакета
+            chunks = []
+            for i in range(len(texts)):
+                chunk = waveforms[i]
+                if lengths is not None and len(texts) > 1:
+                    chunk = chunk[:int(lengths[i])]
+                chunks.append(chunk)
+
+            return np.concatenate(chunks), self.sampling_rate
+
+    # Потоковый синтез: текст разбивается на предложения, которые озвучиваются небольшими пакетами
+    def synthesize_stream(self, text: str, speaker=0, seed=555, batch_size=2):
+
+        stats = {"operation": "synthesize_stream", "model": self.model_name, "device": self.device, "variant": self.variant,
+                 "chars": len(text), "audio_seconds": 0.0}
+        started = time.perf_counter()
+
+        try:
+            sentences = split_sentences(text)
+
+            for start in range(0, len(sentences), batch_size):
+                chunk, sampling_rate = self._synthesize_batch(sentences[start:start + batch_size], speaker, seed)
+                stats.setdefault("time_to_first_chunk", time.perf_counter() - started)
+                stats["audio_seconds"] += len(chunk) / sampling_rate
+                yield chunk, sampling_rate
+        except Exception as e:
+            stats["error"] = repr(e)
+            raise
+        finally:
+            _record_tts(stats, time.perf_counter() - started)
+
+
+def _record_tts(stats, wall_time):
+    audio_seconds = stats.get("audio_seconds")
+    record("tts", wall_time=wall_time, real_time_factor=wall_time / audio_seconds if audio_seconds else None, **stats)
+
+
+# Реестр движков на процесс (по одному на устройство); режим инференса берётся из TTS_THREADS/TTS_QUANTIZE/TTS_COMPILE
+_engines = {}
+_engines_lock = threading.Lock()
+_warmups = {}   # устройство -> поток фоновой загрузки
+
+
+def get_engine(device='cpu'):
+
+    with _engines_lock:
+        if device not in _engines:
+            _engines[device] = tts_engine(device=device, threads=TTS_THREADS, quantize=TTS_QUANTIZE, compile=TTS_COMPILE)
+        return _engines[device]
+
+
+# Предварительная загрузка моделей при старте приложения
+def warm_up(device='cpu', background=True):
+
+    engine = get_engine(device)
+
+    if engine.is_loaded:
+        return None
+
+    if background:
+        # повторный вызов во время загрузки возвращает уже запущенный поток
+        with _engines_lock:
+            thread = _warmups.get(device)
+            if thread is None or not thread.is_alive():
+                thread = _warmups[device] = threading.Thread(target=engine.load, name=f"tts-warmup-{device}", daemon=True)
+                thread.start()
+        return thread
+
+    engine.load()
+    return None
+
+
+# Явная выгрузка моделей (освобождение памяти)
+def unload(device=None):
+
+    with _engines_lock:
+        devices = [device] if device is not None else list(_engines)
+        engines = [_engines.pop(d) for d in devices if d in _engines]
+
+    for engine in engines:
+        engine.unload()
+
+
+def generate_speech(image_description: str, device='cpu', speaker=0, seed=555):   # speaker: 0-woman, 1-man
 
-    # load accentizer
-    accentizer = RUAccent()
-    accentizer.load(omograph_model_size='turbo', use_dictionary=True, device=device)
+    return get_engine(device).synthesize(image_description, speaker=speaker, seed=seed)
 
-    text = accentizer.process_all(image_description.replace("\n", " "))
 
-    inputs = tokenizer(text, return_tensors="pt")
+# Потоковая версия generate_speech: выдаёт кортежи (фрагмент волны, частота дискретизации)
+def generate_speech_stream(image_description: str, device='cpu', speaker=0, seed=555, batch_size=2):
 
-    with torch.no_grad():
-        output = model(**inputs.to(device), speaker_id=speaker).waveform
-        output = output.detach().cpu().numpy().squeeze() # .squeeze() удаляет лишние измерения
-    
-    return output, model.config.sampling_rate
\ No newline at end of file
+    yield from get_engine(device).synthesize_stream(image_description, speaker=speaker, seed=seed, batch_size=batch_size)
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+from fake_autograph import _scan_bytes, start_fixture_server
+from manuscripts_parser import pars_autograph, sync_manifest
+from scan_store import scan_store
+
+
+# Проверки инкрементальной синхронизации на локальной копии сайта (fake_autograph): python -m pytest -q
+AUTHOR = "Автор 0"
+
+
+@pytest.fixture
+def server():
+    server = start_fixture_server(authors=1, archives=1, materials=2, scans=2)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _scan_requests(server, start=0):
+    return [(path, ranges) for path, ranges in server.requests[start:] if "/sites/" in path]
+
+
+def _sync(server, root, manifest, **kwargs):
+    autograph = pars_autograph(server.base_url, workers=2, min_interval=0)
+    start = len(server.requests)
+    changes, failed = autograph.pars_author(AUTHOR, str(root), manifest, **kwargs)
+    assert failed == []
+    return changes, server.requests[start:]
+
+
+def _scan_paths(root):
+    return sorted(os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names if name.endswith(".png"))
+
+
+def test_rerun_requests_only_pages(server, tmp_path):
+    manifest = sync_manifest(str(tmp_path / "manifest.json"))
+    changes, first = _sync(server, tmp_path / "corpus", manifest)
+    assert sorted(change for change, path in changes if path.endswith(".png")) == ["added"] * 4
+    assert len([r for r in first if "/sites/" in r[0]]) == 4
+
+    changes, rerun = _sync(server, tmp_path / "corpus", sync_manifest(str(tmp_path / "manifest.json")))
+    assert changes == []
+    assert [r for r in rerun if "/sites/" in r[0]] == []
+    # повторный запуск читает только страницы сайта, в том же объёме
+    assert len(rerun) == len(first) - 4
+
+
+def test_changed_revision_is_downloaded_again(server, tmp_path):
+    manifest = sync_manifest(str(tmp_path / "manifest.json"))
+    _sync(server, tmp_path / "corpus", manifest)
+
+    server.site.revisions[(0, 0, 1, 2)] = 1
+    changes, _ = _sync(server, tmp_path / "corpus", manifest, revalidate=True)
+
+    changed = [(change, path) for change, path in changes if path.endswith(".png")]
+    assert len(changed) == 1 and changed[0][0] == "modified"
+    with open(changed[0][1], "rb") as f:
+        assert f.read() == _scan_bytes(0, 0, 1, 2, 1)
+
+
+def test_interrupted_download_resumes_with_range(server, tmp_path):
+    manifest = sync_manifest(str(tmp_path / "manifest.json"))
+    _sync(server, tmp_path / "corpus", manifest)
+
+    # обрыв загрузки: в манифесте недокачанная запись, на диске — половина скана в .part
+    path = _scan_paths(tmp_path / "corpus")[0]
+    scan_key = os.path.relpath(path, tmp_path / "corpus")
+    entry = manifest.scan(scan_key)
+    with open(path, "rb") as f:
+        body = f.read()
+    os.remove(path)
+    with open(f"{path}.part", "wb") as f:
+        f.write(body[:len(body) // 2])
+    manifest.put_scan(scan_key, {"url": entry["url"], "etag": entry["etag"], "complete": False})
+
+    start = len(server.requests)
+    changes, _ = _sync(server, tmp_path / "corpus", manifest)
+    assert ("added", path) in changes
+    assert [ranges for _, ranges in _scan_requests(server, start)] == [f"bytes={len(body) // 2}-"]
+    with open(path, "rb") as f:
+        assert f.read() == body
+    assert manifest.scan(scan_key)["complete"]
+
+
+def test_fully_downloaded_part_is_fetched_again(server, tmp_path):
+    manifest = sync_manifest(str(tmp_path / "manifest.json"))
+    _sync(server, tmp_path / "corpus", manifest)
+
+    # .part дописан целиком, но запись манифеста не успела обновиться: сервер ответит 416
+    path = _scan_paths(tmp_path / "corpus")[0]
+    scan_key = os.path.relpath(path, tmp_path / "corpus")
+    entry = manifest.scan(scan_key)
+    os.replace(path, f"{path}.part")
+    manifest.put_scan(scan_key, {"url": entry["url"], "etag": entry["etag"], "complete": False})
+
+    start = len(server.requests)
+    changes, _ = _sync(server, tmp_path / "corpus", manifest)
+    assert ("added", path) in changes
+    assert [ranges for _, ranges in _scan_requests(server, start)] == [f"bytes={entry['size']}-", None]
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_journal_replay_skips_truncated_last_line(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = sync_manifest(path)
+    manifest.put_material("a/b", {"url": "u", "scans": 1})
+    manifest.put_scan("a/b/1.png", {"url": "s", "complete": True, "sha256": "x"})
+    manifest.put_scan("a/b/2.png", {"url": "t", "complete": True, "sha256": "y"})
+    manifest.put_scan("a/b/2.png", None)
+
+    # запуск прерван во время записи строки журнала
+    with open(manifest.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"kind": "scan", "key": "a/b/3.p')
+
+    replayed = sync_manifest(path)
+    assert replayed.material("a/b") == {"url": "u", "scans": 1}
+    assert replayed.scan("a/b/1.png")["sha256"] == "x"
+    assert replayed.scan("a/b/2.png") == {} and replayed.scan("a/b/3.png") == {}
+    assert not os.path.exists(replayed.journal_path)
+
+    # новые записи после восстановления не теряются
+    replayed.put_scan("a/b/3.png", {"url": "v", "complete": True, "sha256": "z"})
+    assert sync_manifest(path).scan("a/b/3.png")["sha256"] == "z"
+
+
+def test_recompressed_scan_is_not_downloaded_again(server, tmp_path):
+    manifest = sync_manifest(str(tmp_path / "manifest.json"))
+    _sync(server, tmp_path / "corpus", manifest, store=scan_store(recompress=True))
+    scan_key, entry = manifest.complete_scans()[0]
+    assert entry["stored_size"] < entry["size"]
+
+    # ETag сменился, содержимое — нет: скан загружается, но остаётся прежним
+    manifest.put_scan(scan_key, dict(entry, etag='"stale"'))
+    changes, _ = _sync(server, tmp_path / "corpus", manifest, revalidate=True, store=scan_store(recompress=True))
+    assert [change for change, path in changes if path.endswith(".png")] == []
+
+    start = len(server.requests)
+    _sync(server, tmp_path / "corpus", manifest, store=scan_store(recompress=True))
+    assert _scan_requests(server, start) == []
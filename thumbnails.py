@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+from PIL import Image
+
+
+# Каталог кэша превью
+DEFAULT_THUMB_DIR = "./data/cache/thumbnails"
+
+# Фиксированные ширины превью (пикселей)
+THUMB_WIDTHS = (160, 320, 640)
+
+
+def _thumb_format():
+    # WebP, если Pillow собран с его поддержкой, иначе JPEG (Image.SAVE заполняется после Image.init())
+    Image.init()
+    return ("WEBP", "webp") if "WEBP" in Image.SAVE else ("JPEG", "jpg")
+
+
+def _nearest_width(width):
+    for w in THUMB_WIDTHS:
+        if w >= width:
+            return w
+    return THUMB_WIDTHS[-1]
+
+
+# Путь к превью: имя зависит от пути, размера и mtime скана, поэтому изменённый скан получает новое превью
+def thumbnail_path(img_path, width, thumb_dir=DEFAULT_THUMB_DIR):
+    stat = os.stat(img_path)
+    source = f"{os.path.abspath(img_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    name = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    return os.path.join(thumb_dir, name[:2], f"{name}_{width}.{_thumb_format()[1]}")
+
+
+# Получить (при необходимости создать) превью скана шириной не меньше width из THUMB_WIDTHS.
+# При ошибке возвращается исходный путь
+def get_thumbnail(img_path, width=320, quality=80, thumb_dir=DEFAULT_THUMB_DIR):
+    width = _nearest_width(width)
+
+    try:
+        path = thumbnail_path(img_path, width, thumb_dir)
+        if os.path.isfile(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image_format = _thumb_format()[0]
+
+        with Image.open(img_path) as img:
+            img.draft("RGB", (width, width * 4))  # ускоряет декодирование JPEG-исходников
+            img = img.convert("RGB")
+            if img.width > width:
+                img.thumbnail((width, round(img.height * width / img.width)), Image.Resampling.LANCZOS)
+
+            tmp_path = f"{path}.tmp"
+            if image_format == "WEBP":
+                img.save(tmp_path, format=image_format, quality=quality, method=4)
+            else:
+                img.save(tmp_path, format=image_format, quality=quality, optimize=True)
+            os.replace(tmp_path, path)
+
+        return path
+    except Exception:
+        return img_path
+
+
+# Предварительная генерация превью для списка сканов
+def build_thumbnails(img_paths, widths=THUMB_WIDTHS):
+    return sum(1 for img_path in img_paths for width in widths if get_thumbnail(img_path, width) != img_path)
+
+
+# Генерация превью для всего корпуса: python thumbnails.py [--root ...]
+if __name__ == "__main__":
+    import argparse
+
+    from catalog import DATASET_DIR, catalog_index
+
+    parser = argparse.ArgumentParser(description="Генерация превью сканов")
+    parser.add_argument("--root", default=DATASET_DIR)
+    args = parser.parse_args()
+
+    catalog = catalog_index(args.root)
+    total = 0
+    for key in catalog.iter_archives():
+        total += build_thumbnails(catalog.get_image_paths(*key))
+    print(f"Превью в кэше: {total}")
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+# Замер синтеза речи на CPU в разных режимах инференса: коэффициент реального времени (RTF)
+# и пиковое потребление памяти. Каждый режим запускается в отдельном процессе, чтобы пиковый RSS
+# и глобальные настройки torch (число потоков) не влияли на другие режимы.
+# Пример: python tts_benchmark.py --configs default,threads=4,int8,int8+threads=4 --output tts_bench.json
+
+# Фиксированный набор описаний, похожих на тифлокомментарии приложения
+DESCRIPTIONS = (
+    "На изображении лист бумаги, исписанный чернилами. Почерк неровный, строки наклонены вправо.",
+    "В верхней части страницы видна дата, ниже идёт обращение к адресату. Некоторые слова зачёркнуты, "
+    "над ними вписаны исправления.",
+    "Это пожелтевшая почтовая открытка. На лицевой стороне изображена заснеженная улица с фонарями и прохожими, "
+    "на обороте — короткое поздравление с Новым годом и подпись.",
+    "Страница из записной книжки в клетку. Текст написан карандашом, местами стёрся и читается с трудом. "
+    "На полях есть небольшой рисунок.",
+    "Машинописный лист с рукописной правкой. В правом нижнем углу стоит номер страницы, "
+    "а в левом верхнем — штамп архива.",
+)
+
+DEFAULT_CONFIGS = "default,threads=1,threads=4,int8,int8+threads=4"
+
+
+# "int8+compile+threads=4" -> {"quantize": True, "compile": True, "threads": 4}
+def parse_config(name):
+    options = {"threads": None, "quantize": False, "compile": False}
+    for part in name.split("+"):
+        if part == "int8":
+            options["quantize"] = True
+        elif part == "compile":
+            options["compile"] = True
+        elif part.startswith("threads="):
+            options["threads"] = int(part.split("=", 1)[1])
+        elif part != "default":
+            raise ValueError(f"Неизвестный параметр режима: {part}")
+    return options
+
+
+def _peak_rss_bytes():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS — байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Замер одного режима в текущем процессе
+def run_config(name, repeat=1, speaker=0, seed=555):
+    from speech_generator import split_sentences, tts_engine
+
+    # кэш ударений только в памяти: замеры не пишут в кэш приложения и не получают из него готовых ударений
+    engine = tts_engine(**parse_config(name), accent_cache_path=None)
+
+    started = time.perf_counter()
+    engine.load()
+    load_seconds = time.perf_counter() - started
+
+    # ударения расставляются один раз до замеров, чтобы RTF всех режимов сравнивал только инференс VITS
+    started = time.perf_counter()
+    for text in DESCRIPTIONS:
+        engine.accents.accent_sentences(split_sentences(text))
+    accent_seconds = time.perf_counter() - started
+
+    # первый вызов отдельно: в нём прогрев (и компиляция при compile)
+    started = time.perf_counter()
+    engine.synthesize(DESCRIPTIONS[0], speaker, seed)
+    first_call_seconds = time.perf_counter() - started
+
+    wall_seconds = audio_seconds = 0.0
+    for _ in range(repeat):
+        for text in DESCRIPTIONS:
+            started = time.perf_counter()
+            waveform, sampling_rate = engine.synthesize(text, speaker, seed)
+            wall_seconds += time.perf_counter() - started
+            audio_seconds += len(waveform) / sampling_rate
+
+    return {"config": name,
+            "variant": engine.variant,
+            "load_seconds": load_seconds,
+            "accent_seconds": accent_seconds,
+            "first_call_seconds": first_call_seconds,
+            "wall_seconds": wall_seconds,
+            "audio_seconds": audio_seconds,
+            "real_time_factor": wall_seconds / audio_seconds if audio_seconds else None,
+            "peak_rss_mb": _peak_rss_bytes() / 1024 / 1024}
+
+
+def run_isolated(name, repeat):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--single", name, "--repeat", str(repeat)],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"config": name, "error": (completed.stderr.strip().splitlines() or ["неизвестная ошибка"])[-1]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры синтеза речи на CPU: RTF и пиковая память по режимам")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS,
+                        help="режимы через запятую; режим — default или комбинация int8, compile, threads=N через +")
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз синтезировать набор описаний")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="файл для JSON-результата (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    if args.single:
+        import tempfile
+
+        import metrics
+
+        # метрики замеров не смешиваются с метриками приложения
+        metrics_dir = tempfile.mkdtemp(prefix="htr-tts-bench-")
+        metrics.METRICS_LOG = os.path.join(metrics_dir, "metrics.jsonl")
+        metrics.METRICS_FILE = os.path.join(metrics_dir, "metrics.prom")
+
+        print(json.dumps(run_config(args.single, args.repeat)))
+        raise SystemExit(0)
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "cpu_count": os.cpu_count(),
+              "descriptions": len(DESCRIPTIONS),
+              "runs": []}
+
+    for name in [c for c in args.configs.split(",") if c]:
+        parse_config(name)
+        run = run_isolated(name, args.repeat)
+        report["runs"].append(run)
+        if "error" in run:
+            print(f"{name}: ошибка {run['error']}", file=sys.stderr)
+        else:
+            print(f"{name}: RTF {run['real_time_factor']:.3f}, пиковая память {run['peak_rss_mb']:.0f} МБ", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
@@ -0,0 +1,51 @@
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+import pandas as pd
+
+
+# Частотный словарь современного русского языка (ранг, лемма)
+VOCABULARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "most_frequent_words.csv")
+
+STEM_LEN = 5
+
+_WORD = re.compile(r"[а-яё]+")
+
+
+def _normalize(word):
+    return word.lower().replace("ё", "е")
+
+
+# Словарь загружается один раз на процесс; слова упорядочены по частоте
+@lru_cache(maxsize=None)
+def load_vocabulary(path=VOCABULARY_PATH):
+    return tuple(str(word) for word in pd.read_csv(path, header=None).iloc[:, -1].values)
+
+
+# Индекс «основа -> леммы словаря» для поиска словарных форм слов исходного текста
+@lru_cache(maxsize=None)
+def _stem_index(path=VOCABULARY_PATH):
+    index = defaultdict(list)
+    for word in load_vocabulary(path):
+        index[_normalize(word)[:STEM_LEN]].append(word)
+    return index
+
+
+# Подмножество словаря для промпта: самые частотные слова и словарные формы,
+# близкие к словам исходного текста (совпадение по основе). Размер растёт с длиной текста, а не словаря
+def vocabulary_for_text(text, core_size=150, per_word=3, path=VOCABULARY_PATH):
+    vocabulary = load_vocabulary(path)
+    index = _stem_index(path)
+
+    selected = dict.fromkeys(vocabulary[:core_size])
+
+    for word in _WORD.findall(_normalize(text or "")):
+        if len(word) < 3:
+            continue
+        for candidate in index.get(word[:STEM_LEN], ())[:per_word]:
+            if len(word) >= STEM_LEN or _normalize(candidate) == word:
+                selected[candidate] = None
+
+    return list(selected)